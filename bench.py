@@ -1,30 +1,108 @@
-import sqlite3, time, psycopg2
+import sqlite3, time, os, psycopg2
+import latency, results, retry, memory, ioStats, timeseries, soak, pragmas as sqlitePragmas
 
-def withSqliteConnection(dbFileName, f, isolationLevel, useWal = False, timeout = 60):
+# Workloads by name. Each entry holds the function to run per backend.
+registry = {}
+# False while warm-up runs are in progress so that their numbers are not reported.
+reporting = True
+
+def register(name, sqlite = None, pgsql = None, perConnection = True, fixture = False, params = ()):
+    # perConnection workloads are called as f(conn, ctx) with a connection opened by the runner,
+    # the others as f(ctx) and open their own connections through withConnection().
+    # fixture workloads read the datagen data, restored by the runner from fixtures.py.
+    # params are the swept runner settings the workload reads, the runner only sweeps those for it.
+    registry[name] = {
+        'sqlite': sqlite, 'pgsql': pgsql, 'perConnection': perConnection, 'fixture': fixture, 'params': params
+    }
+
+def param(ctx, name, default):
+    value = ctx.get(name)
+    value = default if value is None else value
+    # Record the value actually used so that results show workload defaults too.
+    results.context[name] = value
+    return value
+
+def connectSqlite(dbFileName, isolationLevel, useWal = False, timeout = 60, pragmas = None, cachedStatements = 128):
+    # Connections may be handed over between threads by a pool, one thread at a time.
+    # 'file:' names are URIs, such as the shared in-memory database of storage.py.
+    conn = sqlite3.connect(
+        dbFileName, timeout, check_same_thread = False, cached_statements = cachedStatements,
+        uri = dbFileName.startswith('file:')
+    )
+    conn.isolation_level = isolationLevel
+    if useWal:
+        conn.execute("PRAGMA journal_mode=WAL")
+    if pragmas:
+        sqlitePragmas.apply(conn, pragmas)
+    return conn
+
+def withSqliteConnection(dbFileName, f, isolationLevel, useWal = False, timeout = 60, pragmas = None):
+    conn = None
     try:
-        conn = sqlite3.connect(dbFileName, timeout)
-        conn.isolation_level = isolationLevel
         if useWal:
             print('Using WAL...')
-            conn.execute("PRAGMA journal_mode=WAL")
         else:
             print('Using rollback journal...')
+        if pragmas:
+            print('Using pragmas %s...' % sqlitePragmas.describe(pragmas))
+        conn = connectSqlite(dbFileName, isolationLevel, useWal, timeout, pragmas)
         f(conn)
     finally:
         if conn:
             conn.close()
 
+def connectPgsql(database = "testDb"):
+    conn = psycopg2.connect(
+        database = database, port = "5431", host = "/tmp"
+    )
+    memory.trackPgsql(conn)
+    return conn
+
 def withPgsqlConnection(f):
+    conn = None
     try:
-        conn = psycopg2.connect(
-            database = "testDb", port = "5431", host = "/tmp"
-        )
+        conn = connectPgsql()
         f(conn)
         conn.commit()
     finally:
         if conn:
             conn.close()
 
+def connect(ctx):
+    # Same as withConnection() but without messages, for callers managing connections themselves.
+    if ctx['backend'] == 'sqlite':
+        return connectSqlite(
+            ctx['db'], isolationLevel = None, useWal = ctx['wal'], timeout = retry.connectTimeout(),
+            pragmas = ctx.get('pragmas'), cachedStatements = ctx.get('cached_statements', 128)
+        )
+    return connectPgsql()
+
+def withConnection(ctx, f):
+    if ctx['backend'] == 'sqlite':
+        # 'isolationLevel = None' means auto commit.
+        withSqliteConnection(
+            ctx['db'], f, isolationLevel = None, useWal = ctx['wal'], timeout = retry.connectTimeout(),
+            pragmas = ctx.get('pragmas')
+        )
+    else:
+        withPgsqlConnection(f)
+
+def resetSqlite(dbFileName):
+    for suffix in ['', '-wal', '-shm', '-journal']:
+        if os.path.exists(dbFileName + suffix):
+            os.remove(dbFileName + suffix)
+
+def dropTablesPgsql(conn):
+    cur = conn.cursor()
+    cur.execute("drop table if exists user_department, users, addresses, departments cascade")
+    conn.commit()
+
+def resetDatabase(ctx):
+    if ctx['backend'] == 'sqlite':
+        resetSqlite(ctx['db'])
+    else:
+        withPgsqlConnection(dropTablesPgsql)
+
 def createTableSqlite(conn):
     primariKeySpec = "integer primary key autoincrement"
     conn.execute("""
@@ -86,8 +164,95 @@ def createTableCommon(conn, primariKeySpec):
       create index department_created on departments ( created )
     """)
 
-def withStopwatch(title, f):
-    start = time.time()
+def chunks(indicies, size):
+    # Slices of a range are ranges as well, so no chunk is materialized up front.
+    for x in range(0, len(indicies), size):
+        yield indicies[x:x+size]
+
+# Commits of at least this many records are marked in the time series.
+LARGE_COMMIT = 10000
+
+def bulkUpdate(conn, beginTranFunc, commitTranFunc, updateFunc, hist, rows, batch, txn):
+    cur = conn.cursor()
+    # Commit every 'txn' records, passing 'batch' records at once to updateFunc.
+    for tran in chunks(range(1, rows + 1), txn):
+        start = latency.now()
+        beginTranFunc(cur)
+        for chunk in chunks(tran, batch):
+            updateFunc(cur, chunk)
+        commitTranFunc(cur)
+        elapsed = latency.now() - start
+        hist.record(elapsed)
+        if len(tran) >= LARGE_COMMIT:
+            timeseries.mark('commit', '%d records %.3fms' % (len(tran), elapsed / 1e6))
+    return rows
+
+def withStopwatch(title, f, hist = None):
+    # f may return the number of records it processed to have records/sec reported.
+    if not reporting:
+        # Sampled by the sampler of a process worker, if any.
+        if hist is not None:
+            track(hist, title)
+        f()
+        return None
+    mem = memory.begin() if memory.enabled else None
+    io = ioStats.begin() if ioStats.enabled else None
+    phase = soak.begin()
+    if hist is not None:
+        soak.track(hist)
+    sampler = timeseries.Sampler(title) if timeseries.interval else None
+    if sampler:
+        if hist is not None:
+            sampler.track(hist, 'phase')
+        sampler.begin()
+    start = time.perf_counter()
     print('%s started...' % title)
-    f()
-    print('%s %.3f secs' % (title, time.time() - start))
+    try:
+        rows = f()
+        # Without the warm-up, if the loops of f ran into it and cleared the histograms. Phases within
+        # a phase, such as the threads of the concurrent workload, share the warm-up of the outer one.
+        outer = soak.current()
+        elapsed = time.perf_counter() - (soak.measuredFrom(start) if outer and outer.warmed else start)
+        ioUsed = ioStats.end(io) if io is not None else None
+    finally:
+        samples = sampler.end() if sampler else None
+        soak.end(phase)
+    print('%s %.3f secs' % (title, elapsed))
+    r = results.record(title, elapsed, hist)
+    if isinstance(rows, int):
+        r['rows_per_sec'] = rows / elapsed
+        print('%s %.1f records/sec' % (title, r['rows_per_sec']))
+    if hist is not None and hist.count:
+        print(latency.describe(title, hist, elapsed))
+    if mem is not None:
+        stats = memory.end(mem)
+        r.update(stats)
+        print(memory.describe(title, stats))
+    if ioUsed is not None:
+        r.update(ioUsed)
+        print(ioStats.describe(title, ioUsed))
+    if samples:
+        print(timeseries.describe(title, samples))
+    return r
+
+def track(hist, source):
+    # For histograms of client threads and the like, recorded into within a phase.
+    timeseries.track(hist, source)
+    soak.track(hist)
+
+def withLatency(title, f):
+    # f receives the histogram and records one sample per operation into it.
+    hist = latency.Histogram(title)
+    withStopwatch(title, lambda: f(hist), hist)
+    return hist
+
+def measureEach(title, doNtimes, performer):
+    # Record latency of every performer call in addition to the total time.
+    hist = latency.Histogram(title)
+    lock = retry.resetThreadStats()
+    r = withStopwatch(title, lambda: doNtimes(latency.timed(hist, performer)), hist)
+    retry.addPhase(title, lock)
+    if r is not None and (lock.busy or lock.timeouts):
+        r.update(lock.summary())
+        print(retry.describe(title, lock))
+    return hist
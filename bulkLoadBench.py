@@ -0,0 +1,201 @@
+"""Perform bulk load benchmark test.
+
+Registers the 'bulk-load' workload. Running this script is the same as 'runner.py bulk-load'.
+Loads 100000 datagen users (see --rows) with each of these engines, passing --batch rows at
+once and committing every --txn rows:
+    executemany       One INSERT run for every row by executemany().
+    values            Multi-row INSERT ... VALUES (...), (...) of --values-rows rows each.
+    staging           (SQLite) executemany() into a table of an attached in-memory database,
+                      moved by INSERT ... SELECT at every commit.
+    execute_values    (Postgres) psycopg2.extras.execute_values() with --values-rows rows per
+                      statement.
+    copy              (Postgres) COPY of every batch formatted into a StringIO.
+    copy-stream       (Postgres) One COPY reading the rows from a file-like object fed by the
+                      generator, so no batch is ever built in memory. --batch and --txn do not
+                      apply.
+Throughput and the peak RSS of the process while loading (see memory.py) are reported for
+each engine.
+"""
+
+import sys, bench, latency, memory, datagen
+import psycopg2.extras
+
+COLUMNS = dict((table, columns) for table, columns, driving, rowsOf in datagen.TABLES)['users']
+
+class LineReader:
+    """File-like object reading the lines of a generator, for COPY FROM."""
+    def __init__(self, lines):
+        self.lines = lines
+        self.buffer = ''
+
+    def read(self, size = -1):
+        parts = [self.buffer]
+        length = len(self.buffer)
+        for line in self.lines:
+            parts.append(line)
+            length += len(line)
+            if 0 <= size <= length:
+                break
+        data = ''.join(parts)
+        if size < 0:
+            size = len(data)
+        self.buffer = data[size:]
+        return data[:size]
+
+    def readline(self, size = -1):
+        if self.buffer:
+            line, self.buffer = self.buffer, ''
+            return line
+        return next(self.lines, '')
+
+def take(stream, chunk):
+    return [next(stream) for i in chunk]
+
+def valuesSql(placeholder, n):
+    row = '(%s)' % ', '.join([placeholder] * len(COLUMNS))
+    return "insert into users (%s) values %s" % (', '.join(COLUMNS), ', '.join([row] * n))
+
+def groups(rows, size):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+def executemanyEngine(placeholder):
+    sql = valuesSql(placeholder, 1)
+    return lambda cur, stream, ctx: lambda cur, chunk: cur.executemany(sql, take(stream, chunk))
+
+def valuesEngineSqlite(cur, stream, ctx):
+    size = bench.param(ctx, 'values_rows', 100)
+    statements = {}
+
+    def insertFunc(cur, chunk):
+        for rows in groups(take(stream, chunk), size):
+            if len(rows) not in statements:
+                statements[len(rows)] = valuesSql('?', len(rows))
+            cur.execute(statements[len(rows)], [v for r in rows for v in r])
+
+    return insertFunc
+
+def valuesEnginePgsql(cur, stream, ctx):
+    size = bench.param(ctx, 'values_rows', 100)
+    sql = "insert into users (%s) values " % ', '.join(COLUMNS)
+    row = '(%s)' % ', '.join(['%s'] * len(COLUMNS))
+
+    def insertFunc(cur, chunk):
+        for rows in groups(take(stream, chunk), size):
+            cur.execute(sql.encode() + b', '.join(cur.mogrify(row, r) for r in rows))
+
+    return insertFunc
+
+def executeValuesEngine(cur, stream, ctx):
+    size = bench.param(ctx, 'values_rows', 100)
+    sql = "insert into users (%s) values %%s" % ', '.join(COLUMNS)
+    return lambda cur, chunk: psycopg2.extras.execute_values(cur, sql, take(stream, chunk), page_size = size)
+
+def copyEngine(cur, stream, ctx):
+    insert = datagen.copyPgsql('users', COLUMNS)
+    return lambda cur, chunk: insert(cur, take(stream, chunk))
+
+def loadSqliteStaging(conn, stream, ctx, hist, rows):
+    cur = conn.cursor()
+    cur.execute("attach database ':memory:' as staging")
+    cur.execute("create table staging.users as select * from main.users where 0")
+    sql = "insert into staging.users (%s) values (%s)" % (', '.join(COLUMNS), ', '.join(['?'] * len(COLUMNS)))
+
+    def commit(cur):
+        cur.execute("insert into main.users select * from staging.users")
+        cur.execute("delete from staging.users")
+        cur.execute('COMMIT')
+
+    try:
+        return bench.bulkUpdate(
+            conn, lambda cur: cur.execute('BEGIN TRANSACTION'), commit,
+            lambda cur, chunk: cur.executemany(sql, take(stream, chunk)),
+            hist, rows, ctx['batch'], bench.param(ctx, 'txn', ctx['batch'])
+        )
+    finally:
+        cur.execute("detach database staging")
+
+def loadPgsqlCopyStream(conn, stream, ctx, hist, rows):
+    start = latency.now()
+    conn.cursor().copy_from(LineReader(map(datagen.copyLine, stream)), 'users', columns = COLUMNS)
+    conn.commit()
+    hist.record(latency.now() - start)
+    return rows
+
+def chunkedLoad(makeInsertFunc, beginTranFunc, commitTranFunc):
+    def load(conn, stream, ctx, hist, rows):
+        return bench.bulkUpdate(
+            conn, beginTranFunc, commitTranFunc, makeInsertFunc(conn.cursor(), stream, ctx),
+            hist, rows, ctx['batch'], bench.param(ctx, 'txn', ctx['batch'])
+        )
+    return load
+
+def bulkLoadBench(conn, ctx, backendName, loadAddresses, engines, clear):
+    rows = bench.param(ctx, 'rows', 100000)
+    # Recorded for every engine so that runs differing in it are not taken for repeats.
+    bench.param(ctx, 'values_rows', 100)
+    s = dict(datagen.spec(ctx), users = rows)
+    loadAddresses(s)
+    for name, load in engines:
+        clear()
+        hist = latency.Histogram()
+        peak = {}
+
+        def perform():
+            count, peak['peak'], peak['before'] = memory.measurePeak(
+                lambda: load(conn, datagen.users(s), ctx, hist, rows)
+            )
+            return count
+
+        title = "load users with %s %s" % (backendName, name)
+        r = bench.withStopwatch(title, perform, hist)
+        if r is not None:
+            r['peak_rss_mb'] = peak['peak'] / 1e6
+            r['rss_growth_mb'] = (peak['peak'] - peak['before']) / 1e6
+            print('%s peak RSS %.1fMB (+%.1fMB)' % (title, r['peak_rss_mb'], r['rss_growth_mb']))
+
+def bulkLoadBenchSqlite(conn, ctx):
+    begin = lambda cur: cur.execute('BEGIN TRANSACTION')
+    commit = lambda cur: cur.execute('COMMIT')
+
+    def loadAddresses(s):
+        cur = conn.cursor()
+        cur.execute('BEGIN TRANSACTION')
+        datagen.insertSqlite('addresses', ('address_id', 'address'))(cur, list(datagen.addresses(s)))
+        cur.execute('COMMIT')
+
+    bench.createTableSqlite(conn)
+    bulkLoadBench(conn, ctx, 'SQLite', loadAddresses, [
+        ('executemany', chunkedLoad(executemanyEngine('?'), begin, commit)),
+        ('values', chunkedLoad(valuesEngineSqlite, begin, commit)),
+        ('staging', loadSqliteStaging),
+    ], lambda: conn.execute("delete from users"))
+
+def bulkLoadBenchPgsql(conn, ctx):
+    begin = lambda cur: None
+    commit = lambda cur: conn.commit()
+
+    def loadAddresses(s):
+        datagen.copyPgsql('addresses', ('address_id', 'address'))(conn.cursor(), datagen.addresses(s))
+        conn.commit()
+
+    def clear():
+        conn.cursor().execute("truncate users cascade")
+        conn.commit()
+
+    bench.createTablePgsql(conn)
+    bulkLoadBench(conn, ctx, 'Postgres', loadAddresses, [
+        ('executemany', chunkedLoad(executemanyEngine('%s'), begin, commit)),
+        ('values', chunkedLoad(valuesEnginePgsql, begin, commit)),
+        ('execute_values', chunkedLoad(executeValuesEngine, begin, commit)),
+        ('copy', chunkedLoad(copyEngine, begin, commit)),
+        ('copy-stream', loadPgsqlCopyStream),
+    ], clear)
+
+bench.register(
+    'bulk-load', sqlite = bulkLoadBenchSqlite, pgsql = bulkLoadBenchPgsql, params = ['batch', 'txn', 'values_rows']
+)
+
+if __name__ == '__main__':
+    import runner
+    runner.main(['bulk-load'] + sys.argv[1:])
@@ -0,0 +1,92 @@
+"""Cache state of the read phases (runner --cache).
+
+    warm         The connection that loaded the data runs the reads, so SQLite's page cache and
+                 the OS page cache hold what the load left there.
+    sqlite-cold  A fresh connection runs the reads: SQLite's page cache and parsed schema, or the
+                 catalog and plan caches of a new Postgres backend, start empty. The OS page
+                 cache and Postgres shared buffers stay warm, as after a service restart.
+    os-cold      The database files are also evicted from the OS page cache first, through
+                 /proc/sys/vm/drop_caches when running as root and it is writable, else with
+                 posix_fadvise(POSIX_FADV_DONTNEED) on every file, as after a host restart. The
+                 Postgres data directory is that of runner --pgdata. Postgres shared buffers are
+                 only emptied by restarting the server, which is not done.
+The first query of a read phase is kept apart from the steady state: it is reported as
+first_query_ms and left out of the latency histogram of the phase.
+"""
+
+import os, latency, bench
+
+STATES = ('warm', 'sqlite-cold', 'os-cold')
+
+class FirstSplit(latency.Histogram):
+    """Histogram keeping its first sample apart. Resetting it after a warm-up keeps the first."""
+    def __init__(self, title = None):
+        self.first = None
+        super().__init__(title)
+
+    def record(self, nanos):
+        if self.first is None:
+            self.first = nanos
+        else:
+            super().record(nanos)
+
+def databaseFiles(ctx):
+    if ctx['backend'] == 'pgsql':
+        return [os.path.join(root, name) for root, dirs, names in os.walk(ctx['pgdata']) for name in names]
+    return [ctx['db'] + suffix for suffix in ('', '-wal', '-journal') if os.path.exists(ctx['db'] + suffix)]
+
+def dropCaches():
+    if os.geteuid() != 0:
+        return False
+    os.sync()
+    try:
+        with open('/proc/sys/vm/drop_caches', 'w') as f:
+            f.write('1\n')
+    except OSError:
+        # Read-only in most containers.
+        return False
+    return True
+
+def fadvise(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        # Dirty pages are not dropped, write them out first.
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+def evict(ctx):
+    """Evict the database files from the OS page cache. Returns how."""
+    if dropCaches():
+        return 'drop_caches'
+    for path in databaseFiles(ctx):
+        try:
+            fadvise(path)
+        except OSError:
+            # Files of the Postgres server not readable by the benchmark user.
+            pass
+    return 'fadvise'
+
+def withLatency(title, conn, ctx, f):
+    """bench.withLatency for read phases: f(conn, hist) runs the reads on the connection of the
+    cache state of ctx and records one sample per query into hist. Returns the record of the
+    phase like bench.withStopwatch."""
+    state = bench.param(ctx, 'cache', 'warm')
+    if state not in STATES:
+        raise ValueError('Unknown cache state: %s (known: %s)' % (state, ', '.join(STATES)))
+    eviction = evict(ctx) if state == 'os-cold' else None
+    if state != 'warm':
+        conn = bench.connect(ctx)
+    hist = FirstSplit(title)
+    try:
+        r = bench.withStopwatch(title, lambda: f(conn, hist), hist)
+    finally:
+        if state != 'warm':
+            conn.close()
+    if r is not None and hist.first is not None:
+        r['first_query_ms'] = hist.first / 1e6
+        if eviction:
+            r['eviction'] = eviction
+        print('%s first query (%s) %.3fms' % (title, state, r['first_query_ms']))
+    return r
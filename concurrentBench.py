@@ -1,15 +1,18 @@
 """Perform concurrent insert/query benchmark test.
 
-usage: concurrentBench.py [-h] [--wal]
-
-options:
-    -h, --help  Show this help message and exit
-    --wal       Use WAL(Write a head log) instead of traditional rollback journal for SQLite.
+Registers the 'concurrent' workload. Running this script is the same as 'runner.py concurrent'.
+Four threads insert 300 records each (see --rows), then four threads query 50000 times each
+(see --iterations).
+
+Also registers the 'concurrent-process' workload that runs the same performers in OS processes,
+so that processes are not serialized by the GIL. Writer and reader processes (see --writers and
+--readers) run at the same time against the same database, each running its performers on
+threads as above. Their latency histograms are merged and the throughput of a performer is over
+the longest time it ran in any process.
 """
 
-from docopt import docopt
-import io, datetime, bench, time
-import threading
+import io, sys, datetime, bench, time, latency, results, retry, timeseries, soak, storage
+import threading, multiprocessing
 
 N2 = 50000
 
@@ -21,9 +24,8 @@ def doInTransaction(conn, beginTranFunc, commitTranFunc, func):
     return ret
 
 def doInTransactionSqlite(conn, func):
-    return doInTransaction(
-        conn, lambda cur: cur.execute('BEGIN TRANSACTION'), lambda cur: cur.execute('COMMIT'), func
-    )
+    # BEGIN/COMMIT and SQLITE_BUSY handling follow retry.policy.
+    return retry.transaction(conn, func)
 
 def doInTransactionPgsql(conn, func):
     return doInTransaction(
@@ -31,17 +33,18 @@ def doInTransactionPgsql(conn, func):
     )
     
 def getKeysSqlite(conn, picker):
+    # Wait until the other threads have inserted a row to pick.
     keys = doInTransactionSqlite(conn, picker)
-    if keys is None:
+    while keys is None:
         time.sleep(0.3)
-        return getKeysSqlite(conn, picker)
+        keys = doInTransactionSqlite(conn, picker)
     return keys
 
 def getKeysPgsql(conn, picker):
     keys = doInTransactionPgsql(conn, picker)
-    if keys is None:
+    while keys is None:
         time.sleep(0.3)
-        return getKeysPgsql(conn, picker)
+        keys = doInTransactionPgsql(conn, picker)
     return keys
 
 def addrPicker(cur):
@@ -63,9 +66,9 @@ def insertDepartmentSqlite(conn, doNtimes):
             ("dept%08d" % i, )
         )
 
-    bench.withStopwatch(
-        "insert departments with SQLite",
-        lambda: doNtimes(lambda i: doInTransactionSqlite(conn, lambda cur: insertFunc(cur, i)))
+    return bench.measureEach(
+        "insert departments with SQLite", doNtimes,
+        lambda i: doInTransactionSqlite(conn, lambda cur: insertFunc(cur, i))
     )
 
 def insertAddressSqlite(conn, doNtimes):
@@ -74,9 +77,9 @@ def insertAddressSqlite(conn, doNtimes):
             "insert into addresses (address) values (?)", ("addr%08d" % i, )
         )
 
-    bench.withStopwatch(
-        "insert addresses with SQLite",
-        lambda: doNtimes(lambda i: doInTransactionSqlite(conn, lambda cur: insertFunc(cur, i)))
+    return bench.measureEach(
+        "insert addresses with SQLite", doNtimes,
+        lambda i: doInTransactionSqlite(conn, lambda cur: insertFunc(cur, i))
     )
 
 def insertUserSqlite(conn, doNtimes):
@@ -91,7 +94,7 @@ def insertUserSqlite(conn, doNtimes):
         keys = getKeysSqlite(conn, addrPicker)
         doInTransactionSqlite(conn, lambda cur: insertFunc(cur, i, keys))
 
-    bench.withStopwatch("insert users with SQLite", lambda: doNtimes(performer))
+    return bench.measureEach("insert users with SQLite", doNtimes, performer)
 
 def insertUserDepartmentSqlite(conn, doNtimes):
     def insertFunc(cur, i, keys):
@@ -103,8 +106,8 @@ def insertUserDepartmentSqlite(conn, doNtimes):
         keys = getKeysSqlite(conn, userDeptPicker)
         doInTransactionSqlite(conn, lambda cur: insertFunc(cur, i, keys))
 
-    bench.withStopwatch(
-        "insert user_department with SQLite", lambda: doNtimes(performer)
+    return bench.measureEach(
+        "insert user_department with SQLite", doNtimes, performer
     )
 
 def insertDepartmentPgsql(conn, doNtimes):
@@ -117,9 +120,9 @@ def insertDepartmentPgsql(conn, doNtimes):
     def performer(i):
         doInTransactionPgsql(conn, lambda cur: insertFunc(cur, i))
 
-    bench.withStopwatch("insert departments with Postgres", lambda: doNtimes(performer))
+    return bench.measureEach("insert departments with Postgres", doNtimes, performer)
 
-def insertAddressPgsql(conn, n):
+def insertAddressPgsql(conn, doNtimes):
     def insertFunc(cur, i):
         cur.execute(
             "insert into addresses (address) values (%s)", ("addr%08d" % i, )
@@ -128,7 +131,7 @@ def insertAddressPgsql(conn, n):
     def performer(i):
         doInTransactionPgsql(conn, lambda cur: insertFunc(cur, i))
 
-    bench.withStopwatch("insert addresses with Postgres", lambda: doNtimes(performer))
+    return bench.measureEach("insert addresses with Postgres", doNtimes, performer)
 
 def insertUserPgsql(conn, doNtimes):
     def insertFunc(cur, i, keys):
@@ -142,7 +145,7 @@ def insertUserPgsql(conn, doNtimes):
         keys = getKeysPgsql(conn, addrPicker)
         doInTransactionPgsql(conn, lambda cur: insertFunc(cur, i, keys))
 
-    bench.withStopwatch("insert users with Postgres", lambda: doNtimes(performer))
+    return bench.measureEach("insert users with Postgres", doNtimes, performer)
 
 def insertUserDepartmentPgsql(conn, doNtimes):
     def insertFunc(cur, i, keys):
@@ -152,23 +155,16 @@ def insertUserDepartmentPgsql(conn, doNtimes):
 
     def performer(i):
         keys = getKeysPgsql(conn, userDeptPicker)
-        doInTransactionSqlite(conn, lambda cur: insertFunc(cur, i, keys))
+        doInTransactionPgsql(conn, lambda cur: insertFunc(cur, i, keys))
 
-    bench.withStopwatch("insert user_department with Postgres", lambda: doNtimes(performer))
+    return bench.measureEach("insert user_department with Postgres", doNtimes, performer)
 
-def loop(func, n):
-    for i in range(0, n):
+def loop(func, n, start = 0):
+    for i in soak.repeat(n, start):
         func(i)
 
-def doWithThreadSqlite(func):
-    t = threading.Thread(
-        target = lambda : bench.withSqliteConnection("/tmp/test.db", func, isolationLevel = None, useWal = args["--wal"])
-    )
-    t.start()
-    return t
-
-def doWithThreadPgsql(func):
-    t = threading.Thread(target = lambda: bench.withPgsqlConnection(func))
+def doWithThread(ctx, func):
+    t = threading.Thread(target = lambda: bench.withConnection(ctx, func))
     t.start()
     return t
 
@@ -177,56 +173,80 @@ def queryDepartmentSqlite(conn, doNtimes):
     def performer(i):
         cur.execute("select max(created) from departments where created < datetime(CURRENT_TIMESTAMP, '-10 seconds')")
         cur.fetchall()
-    bench.withStopwatch("SQLite query department", lambda: doNtimes(performer))
+    return bench.measureEach("SQLite query department", doNtimes, retry.retrying(performer))
 
 def queryDepartmentPgsql(conn, doNtimes):
     cur = conn.cursor()
     def performer(i):
         cur.execute("select max(created) from departments where created < CURRENT_TIMESTAMP + '-10 seconds'")
         cur.fetchall()
-    bench.withStopwatch("Postgres query department", lambda: doNtimes(performer))
+    return bench.measureEach("Postgres query department", doNtimes, performer)
+
+# Random rows are picked by seeking the primary key index to a random key below the largest one.
+# 'offset random()' used before skipped a huge (SQLite) or 0/1 (Postgres) number of rows.
 
 def queryUserSqlite(conn, doNtimes):
     cur = conn.cursor()
     def performer(i):
-        cur.execute("select * from users order by user_name limit 1 offset random()")
+        cur.execute(
+            "select * from users where user_id >= (select abs(random()) % max(user_id) + 1 from users) " +
+            "order by user_id limit 1"
+        )
         cur.fetchall()
-    bench.withStopwatch("SQLite query user", lambda: doNtimes(performer))
+    return bench.measureEach("SQLite query user", doNtimes, retry.retrying(performer))
 
 def queryUserPgsql(conn, doNtimes):
     cur = conn.cursor()
     def performer(i):
-        cur.execute("select * from users order by user_name limit 1 offset random()")
+        cur.execute(
+            "select * from users where user_id >= (select floor(random() * max(user_id))::integer + 1 from users) " +
+            "order by user_id limit 1"
+        )
         cur.fetchall()
-    bench.withStopwatch("Postgres query user", lambda: doNtimes(performer))
+    return bench.measureEach("Postgres query user", doNtimes, performer)
 
 def queryAddressSqlite(conn, doNtimes):
     cur = conn.cursor()
     def performer(i):
-        cur.execute("select * from addresses order by address limit 1 offset random()")
+        cur.execute(
+            "select * from addresses where address_id >= (select abs(random()) % max(address_id) + 1 from addresses) " +
+            "order by address_id limit 1"
+        )
         cur.fetchall()
-    bench.withStopwatch("SQLite query address", lambda: doNtimes(performer))
+    return bench.measureEach("SQLite query address", doNtimes, retry.retrying(performer))
 
 def queryAddressPgsql(conn, doNtimes):
     cur = conn.cursor()
     def performer(i):
-        cur.execute("select * from addresses order by address limit 1 offset random()")
+        cur.execute(
+            "select * from addresses where address_id >= " +
+            "(select floor(random() * max(address_id))::integer + 1 from addresses) " +
+            "order by address_id limit 1"
+        )
         cur.fetchall()
-    bench.withStopwatch("Postgres query address", lambda: doNtimes(performer))
+    return bench.measureEach("Postgres query address", doNtimes, performer)
 
 def queryUserDepartmentSqlite(conn, doNtimes):
     cur = conn.cursor()
     def performer(i):
-        cur.execute("select * from user_department order by user_id limit 1 offset random()")
+        cur.execute(
+            "select * from user_department where user_department_id >= " +
+            "(select abs(random()) % max(user_department_id) + 1 from user_department) " +
+            "order by user_department_id limit 1"
+        )
         cur.fetchall()
-    bench.withStopwatch("SQLite query user department", lambda: doNtimes(performer))
+    return bench.measureEach("SQLite query user department", doNtimes, retry.retrying(performer))
 
 def queryUserDepartmentPgsql(conn, doNtimes):
     cur = conn.cursor()
     def performer(i):
-        cur.execute("select * from user_department order by user_id limit 1 offset random()")
+        cur.execute(
+            "select * from user_department where user_department_id >= " +
+            "(select floor(random() * max(user_department_id))::integer + 1 from user_department) " +
+            "order by user_department_id limit 1"
+        )
         cur.fetchall()
-    bench.withStopwatch("Postgres query user department", lambda: doNtimes(performer))
+    return bench.measureEach("Postgres query user department", doNtimes, performer)
 
 def doInThreads(*funcs):
     threads = []
@@ -235,48 +255,148 @@ def doInThreads(*funcs):
     for t in threads:
         t.join()
 
-def sqliteQueryBench(args, doNtimes):
+def sqliteQueryBench(ctx, doNtimes):
     doInThreads(
-        lambda: doWithThreadSqlite(lambda conn: queryDepartmentSqlite(conn, doNtimes)),
-        lambda: doWithThreadSqlite(lambda conn: queryAddressSqlite(conn, doNtimes)),
-        lambda: doWithThreadSqlite(lambda conn: queryUserSqlite(conn, doNtimes)),
-        lambda: doWithThreadSqlite(lambda conn: queryUserDepartmentSqlite(conn, doNtimes))
+        lambda: doWithThread(ctx, lambda conn: queryDepartmentSqlite(conn, doNtimes)),
+        lambda: doWithThread(ctx, lambda conn: queryAddressSqlite(conn, doNtimes)),
+        lambda: doWithThread(ctx, lambda conn: queryUserSqlite(conn, doNtimes)),
+        lambda: doWithThread(ctx, lambda conn: queryUserDepartmentSqlite(conn, doNtimes))
     )
 
-def sqliteUpdateBench(args, doNtimes):
-    doWithThreadSqlite(bench.createTableSqlite).join()
+def sqliteUpdateBench(ctx, doNtimes):
+    doWithThread(ctx, bench.createTableSqlite).join()
     doInThreads(
-        lambda: doWithThreadSqlite(lambda conn: insertDepartmentSqlite(conn, doNtimes)),
-        lambda: doWithThreadSqlite(lambda conn: insertAddressSqlite(conn, doNtimes)),
-        lambda: doWithThreadSqlite(lambda conn: insertUserSqlite(conn, doNtimes)),
-        lambda: doWithThreadSqlite(lambda conn: insertUserDepartmentSqlite(conn, doNtimes))
+        lambda: doWithThread(ctx, lambda conn: insertDepartmentSqlite(conn, doNtimes)),
+        lambda: doWithThread(ctx, lambda conn: insertAddressSqlite(conn, doNtimes)),
+        lambda: doWithThread(ctx, lambda conn: insertUserSqlite(conn, doNtimes)),
+        lambda: doWithThread(ctx, lambda conn: insertUserDepartmentSqlite(conn, doNtimes))
     )
 
-def pgsqlQueryBench(args, doNtimes):
+def pgsqlQueryBench(ctx, doNtimes):
     doInThreads(
-        lambda: doWithThreadPgsql(lambda conn: queryDepartmentPgsql(conn, doNtimes)),
-        lambda: doWithThreadPgsql(lambda conn: queryAddressPgsql(conn, doNtimes)),
-        lambda: doWithThreadPgsql(lambda conn: queryUserPgsql(conn, doNtimes)),
-        lambda: doWithThreadPgsql(lambda conn: queryUserDepartmentPgsql(conn, doNtimes))
+        lambda: doWithThread(ctx, lambda conn: queryDepartmentPgsql(conn, doNtimes)),
+        lambda: doWithThread(ctx, lambda conn: queryAddressPgsql(conn, doNtimes)),
+        lambda: doWithThread(ctx, lambda conn: queryUserPgsql(conn, doNtimes)),
+        lambda: doWithThread(ctx, lambda conn: queryUserDepartmentPgsql(conn, doNtimes))
     )
 
-def pgsqlUpdateBench(args, doNtimes):
-    doWithThreadPgsql(bench.createTablePgsql).join()
+def pgsqlUpdateBench(ctx, doNtimes):
+    doWithThread(ctx, bench.createTablePgsql).join()
     doInThreads(
-        lambda: doWithThreadPgsql(lambda conn: insertDepartmentPgsql(conn, doNtimes)),
-        lambda: doWithThreadPgsql(lambda conn: insertAddressPgsql(conn, doNtimes)),
-        lambda: doWithThreadPgsql(lambda conn: insertUserPgsql(conn, doNtimes)),
-        lambda: doWithThreadPgsql(lambda conn: insertUserDepartmentPgsql(conn, doNtimes))
+        lambda: doWithThread(ctx, lambda conn: insertDepartmentPgsql(conn, doNtimes)),
+        lambda: doWithThread(ctx, lambda conn: insertAddressPgsql(conn, doNtimes)),
+        lambda: doWithThread(ctx, lambda conn: insertUserPgsql(conn, doNtimes)),
+        lambda: doWithThread(ctx, lambda conn: insertUserDepartmentPgsql(conn, doNtimes))
     )
 
-if __name__ == '__main__':
-    args = docopt(__doc__)
-
-    doNtimes = lambda func: loop(func, 300)
-    bench.withStopwatch("SQLite update all", lambda: sqliteUpdateBench(args, doNtimes))
-    bench.withStopwatch("Postgres update all", lambda: pgsqlUpdateBench(args, doNtimes))
+def benchSqlite(ctx):
+    doNtimes = lambda func: loop(func, bench.param(ctx, 'rows', 300))
+    bench.withStopwatch("SQLite update all", lambda: sqliteUpdateBench(ctx, doNtimes))
+
+    doNtimes = lambda func: loop(func, bench.param(ctx, 'iterations', 50000))
+    bench.withStopwatch("SQLite query all", lambda: sqliteQueryBench(ctx, doNtimes))
+
+def benchPgsql(ctx):
+    doNtimes = lambda func: loop(func, bench.param(ctx, 'rows', 300))
+    bench.withStopwatch("Postgres update all", lambda: pgsqlUpdateBench(ctx, doNtimes))
+
+    doNtimes = lambda func: loop(func, bench.param(ctx, 'iterations', 50000))
+    bench.withStopwatch("Postgres query all", lambda: pgsqlQueryBench(ctx, doNtimes))
+
+bench.register('concurrent', sqlite = benchSqlite, pgsql = benchPgsql, perConnection = False, params = ['retry', 'begin'])
+
+writerFuncs = {
+    'sqlite': [insertDepartmentSqlite, insertAddressSqlite, insertUserSqlite, insertUserDepartmentSqlite],
+    'pgsql': [insertDepartmentPgsql, insertAddressPgsql, insertUserPgsql, insertUserDepartmentPgsql],
+}
+readerFuncs = {
+    'sqlite': [queryDepartmentSqlite, queryAddressSqlite, queryUserSqlite, queryUserDepartmentSqlite],
+    'pgsql': [queryDepartmentPgsql, queryAddressPgsql, queryUserPgsql, queryUserDepartmentPgsql],
+}
+
+def processWorker(role, index, ctx):
+    # Runs in a child process. Returns the histograms so that the parent can merge them, and
+    # the time series sampled here if the parent samples.
+    bench.reporting = False
+    sampler = None
+    if timeseries.interval:
+        # Forked while the samplers of the parent ran, which may have held the lock. Probes are
+        # left to the parent.
+        timeseries.lock = threading.Lock()
+        del timeseries.active[:], timeseries.series[:], timeseries.events[:], timeseries.probes[:]
+        sampler = timeseries.Sampler("%s process %d" % (role, index))
+        sampler.begin()
+    if role == 'writer':
+        n = bench.param(ctx, 'rows', 300)
+        # Pairs of user_department are picked at random and would collide between writers.
+        funcs = writerFuncs[ctx['backend']] if index == 0 else writerFuncs[ctx['backend']][:3]
+    else:
+        n = bench.param(ctx, 'iterations', 50000)
+        funcs = readerFuncs[ctx['backend']]
+    # Each process uses its own range of keys so that unique names do not collide.
+    doNtimes = lambda func: loop(func, n, index * n)
+    retry.phases.clear()
+    hists = []
+    # With soak.duration, the performers run until the deadline of the phase of the parent.
+    def perform(f):
+        def run(conn):
+            start = time.perf_counter()
+            hist = f(conn, doNtimes)
+            elapsed = time.perf_counter() - (soak.measuredFrom(start) if soak.measuring() else start)
+            hists.append((hist.toDict(), retry.phases[hist.title].toDict(), elapsed))
+        return lambda: doWithThread(ctx, run)
+    doInThreads(*[perform(f) for f in funcs])
+    if sampler:
+        sampler.end()
+    return hists, timeseries.series, timeseries.events
+
+def processBench(ctx):
+    if storage.inMemory(ctx):
+        print('concurrent-process needs a database file, skipped for %s storage.' % ctx['storage'])
+        return
+    writers = bench.param(ctx, 'writers', 1)
+    readers = bench.param(ctx, 'readers', 1)
+    bench.withConnection(ctx, bench.createTableSqlite if ctx['backend'] == 'sqlite' else bench.createTablePgsql)
+    merged = {}
+    locks = {}
+    elapsed = {}
+
+    def perform():
+        pool = multiprocessing.get_context('fork').Pool(writers + readers)
+        try:
+            jobs = [pool.apply_async(processWorker, ('writer', i, ctx)) for i in range(writers)]
+            jobs += [pool.apply_async(processWorker, ('reader', i, ctx)) for i in range(readers)]
+            for job in jobs:
+                hists, series, events = job.get()
+                if bench.reporting:
+                    timeseries.series.extend(series)
+                    timeseries.events.extend(events)
+                for d, lock, seconds in hists:
+                    h = latency.Histogram.fromDict(d)
+                    merged.setdefault(h.title, latency.Histogram(h.title)).merge(h)
+                    locks.setdefault(h.title, retry.LockStats()).merge(retry.LockStats.fromDict(lock))
+                    elapsed[h.title] = max(elapsed.get(h.title, 0), seconds)
+        finally:
+            pool.close()
+            pool.join()
 
-    doNtimes = lambda func: loop(func, 50000)
-    bench.withStopwatch("SQLite query all", lambda: sqliteQueryBench(args, doNtimes))
-    bench.withStopwatch("Postgres query all", lambda: pgsqlQueryBench(args, doNtimes))
+    bench.withStopwatch(
+        "%s with %d writer and %d reader processes" % (ctx['backend'], writers, readers), perform
+    )
+    if bench.reporting:
+        for title, hist in merged.items():
+            # The processes ran the performer at the same time, throughput is over the longest of them.
+            r = results.record(title, elapsed[title], hist)
+            print(latency.describe(title, hist, elapsed[title]))
+            if locks[title].busy or locks[title].timeouts:
+                r.update(locks[title].summary())
+                print(retry.describe(title, locks[title]))
+
+bench.register(
+    'concurrent-process', sqlite = processBench, pgsql = processBench, perConnection = False,
+    params = ['writers', 'readers', 'retry', 'begin']
+)
 
+if __name__ == '__main__':
+    import runner
+    runner.main(['concurrent'] + sys.argv[1:])
@@ -0,0 +1,145 @@
+"""Synthetic data for the users/addresses/departments schema of bench.createTableCommon.
+
+Registers the 'datagen' workload. Running this script is the same as 'runner.py datagen'.
+Loads --scale times 10000 users, each living at one of --addresses addresses (users / 100 by
+default) and belonging to one or two of --departments departments (1000 by default) chosen
+with a Zipf distribution of exponent --zipf, so that a few departments are large and most are
+small.
+Rows are generated in blocks with a random generator seeded from --seed, the table and the
+block number, so the same seed always gives the same data whatever the batch size is. Ids
+are assigned by the generator, so rows referencing other tables need no lookups. Rows are
+streamed in --batch sized batches and committed every --txn rows; pass a large batch such as
+--batch=10000 for big scales.
+"""
+
+import io, sys, time, math, random, itertools, bench
+
+USERS_PER_SCALE = 10000
+# Not scaled with users, so that range scans of departments have a table to scan at any scale.
+DEPARTMENTS = 1000
+BLOCK = 10000
+# Share of users belonging to a second department.
+SECOND_DEPARTMENT = 0.3
+# 2020-01-01 00:00:00 UTC, created timestamps are spread over the following year.
+BASE_TIME = 1577836800
+TIME_SPAN = 365 * 86400
+
+def spec(ctx):
+    users = max(1, int(bench.param(ctx, 'scale', 1) * USERS_PER_SCALE))
+    return {
+        'seed': bench.param(ctx, 'seed', 0),
+        'users': users,
+        'addresses': bench.param(ctx, 'address_count', max(1, users // 100)),
+        'departments': bench.param(ctx, 'department_count', DEPARTMENTS),
+        'zipf': bench.param(ctx, 'zipf', 1.1),
+    }
+
+def timestamp(rnd):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(BASE_TIME + rnd.randrange(TIME_SPAN)))
+
+def generate(s, table, count, makeRow):
+    # Yields makeRow(rnd, id) for ids 1..count, seeding a generator per block of ids.
+    for block in range(math.ceil(count / BLOCK)):
+        rnd = random.Random('%d-%s-%d' % (s['seed'], table, block))
+        for i in range(block * BLOCK + 1, min(count, (block + 1) * BLOCK) + 1):
+            yield makeRow(rnd, i)
+
+def addresses(s):
+    return generate(s, 'addresses', s['addresses'], lambda rnd, i: (i, 'addr%08d' % i))
+
+def departments(s):
+    return generate(s, 'departments', s['departments'], lambda rnd, i: (i, 'dept%08d' % i, timestamp(rnd)))
+
+def users(s):
+    return generate(s, 'users', s['users'], lambda rnd, i: (
+        i, rnd.randint(1, s['addresses']), 'user%08d' % i, 'first%08d' % i, 'last%08d' % i, timestamp(rnd)
+    ))
+
+def zipfWeights(n, exponent):
+    cum = list(itertools.accumulate(1 / (k ** exponent) for k in range(1, n + 1)))
+    return range(1, n + 1), cum
+
+def memberships(s):
+    # One list of (user_id, department_id) per user.
+    population, cum = zipfWeights(s['departments'], s['zipf'])
+
+    def makeRows(rnd, i):
+        picks = rnd.choices(population, cum_weights = cum, k = 2 if rnd.random() < SECOND_DEPARTMENT else 1)
+        return [(i, d) for d in sorted(set(picks))]
+
+    return generate(s, 'user_department', s['users'], makeRows)
+
+TABLES = [
+    ('addresses', ('address_id', 'address'), 'addresses', addresses),
+    ('departments', ('department_id', 'department_name', 'created'), 'departments', departments),
+    ('users', ('user_id', 'address_id', 'user_name', 'first_name', 'last_name', 'created'), 'users', users),
+    ('user_department', ('user_id', 'department_id'), 'users', memberships),
+]
+
+def insertSqlite(table, columns):
+    sql = "insert into %s (%s) values (%s)" % (table, ', '.join(columns), ', '.join(['?'] * len(columns)))
+    return lambda cur, rows: cur.executemany(sql, rows)
+
+def copyLine(row):
+    return '\t'.join(map(str, row)) + '\n'
+
+def copyPgsql(table, columns):
+    return lambda cur, rows: cur.copy_from(
+        io.StringIO(''.join(map(copyLine, rows))), table, columns = columns
+    )
+
+def loadTable(conn, beginTranFunc, commitTranFunc, insert, stream, count, batch, txn, flatten):
+    inserted = [0]
+
+    def insertFunc(cur, chunk):
+        rows = [next(stream) for i in chunk]
+        if flatten:
+            rows = [r for userRows in rows for r in userRows]
+        insert(cur, rows)
+        inserted[0] += len(rows)
+
+    def perform(hist):
+        bench.bulkUpdate(conn, beginTranFunc, commitTranFunc, insertFunc, hist, count, batch, txn)
+        return inserted[0]
+
+    return perform
+
+def load(conn, ctx, beginTranFunc, commitTranFunc, insertFor, backendName):
+    s = spec(ctx)
+    batch = ctx['batch']
+    txn = bench.param(ctx, 'txn', batch)
+    for table, columns, driving, rowsOf in TABLES:
+        # user_department rows are generated per user, so batches are counted in users.
+        perform = loadTable(
+            conn, beginTranFunc, commitTranFunc, insertFor(table, columns), rowsOf(s), s[driving], batch, txn,
+            table == 'user_department'
+        )
+        bench.withLatency("generate %s with %s" % (table, backendName), perform)
+
+def loadSqlite(conn, ctx):
+    bench.createTableSqlite(conn)
+    load(
+        conn, ctx, lambda cur: cur.execute('BEGIN TRANSACTION'), lambda cur: cur.execute('COMMIT'),
+        insertSqlite, 'SQLite'
+    )
+
+def loadPgsql(conn, ctx):
+    bench.createTablePgsql(conn)
+    load(conn, ctx, (lambda cur: None), lambda cur: conn.commit(), copyPgsql, 'Postgres')
+    # Ids were given explicitly, move the serial sequences past them.
+    cur = conn.cursor()
+    for table, column in [
+        ('addresses', 'address_id'), ('departments', 'department_id'), ('users', 'user_id'),
+        ('user_department', 'user_department_id'),
+    ]:
+        cur.execute(
+            "select setval(pg_get_serial_sequence('%s', '%s'), coalesce(max(%s), 0) + 1, false) from %s"
+            % (table, column, column, table)
+        )
+    conn.commit()
+
+bench.register('datagen', sqlite = loadSqlite, pgsql = loadPgsql, params = ['batch', 'txn', 'scale'])
+
+if __name__ == '__main__':
+    import runner
+    runner.main(['datagen'] + sys.argv[1:])
@@ -0,0 +1,100 @@
+"""Perform streaming fetch benchmark test.
+
+Registers the 'fetch' workload. Running this script is the same as 'runner.py fetch'.
+Reads all users of the datagen data (see --scale, restored from a fixture) 3 times (see
+--iterations) with each of these ways of fetching the result:
+    fetchall          All rows at once.
+    fetchmany(n)      n rows at a time, for every n in FETCH_SIZES.
+    iterate           Iterating the cursor row by row.
+    named(n)          (Postgres) Server-side cursor iterated with itersize n. A plain psycopg2
+                      cursor transfers the whole result when the query is executed, so the
+                      other ways only differ in how the client hands out rows it already holds.
+Throughput, the median time from executing the query to the first row and the peak RSS of the
+process while reading (see memory.py) are reported for each of them.
+"""
+
+import sys, itertools, statistics, bench, latency, memory, soak, datagen
+
+FETCH_SIZES = [100, 1000, 10000]
+QUERY = "select * from users"
+
+def fetchall(cur, size):
+    return iter(cur.fetchall())
+
+def fetchmany(cur, size):
+    return itertools.chain.from_iterable(iter(lambda: cur.fetchmany(size), []))
+
+def iterate(cur, size):
+    return iter(cur)
+
+def scan(cur, fetch, size, firstRow):
+    start = latency.now()
+    cur.execute(QUERY)
+    rows = fetch(cur, size)
+    if next(rows, None) is None:
+        return 0
+    if soak.measuring():
+        firstRow.append(latency.now() - start)
+    return 1 + sum(1 for row in rows)
+
+def fetchBench(conn, ctx, backendName, ways, cursor, endRead):
+    n = bench.param(ctx, 'iterations', 3)
+    for name, fetch, size, named in ways:
+        hist = latency.Histogram()
+        firstRow = []
+        peak = {}
+
+        def performScans():
+            count = 0
+            for i in soak.repeat(n):
+                start = latency.now()
+                cur = cursor(size, named)
+                rows = scan(cur, fetch, size, firstRow)
+                if soak.measuring():
+                    count += rows
+                cur.close()
+                endRead()
+                hist.record(latency.now() - start)
+            return count
+
+        def perform():
+            count, peak['peak'], peak['before'] = memory.measurePeak(performScans)
+            return count
+
+        title = "scan users with %s %s" % (backendName, name)
+        r = bench.withStopwatch(title, perform, hist)
+        if r is not None:
+            r['first_row_ms'] = statistics.median(firstRow) / 1e6 if firstRow else None
+            r['peak_rss_mb'] = peak['peak'] / 1e6
+            r['rss_growth_mb'] = (peak['peak'] - peak['before']) / 1e6
+            print('%s first row %.3fms peak RSS %.1fMB (+%.1fMB)' % (
+                title, r['first_row_ms'] or 0, r['peak_rss_mb'], r['rss_growth_mb']
+            ))
+
+def ways(serverSide = False):
+    """Return (name, fetch function, fetch size, whether to use a server-side cursor) of every way."""
+    result = [('fetchall', fetchall, None, False)]
+    result += [('fetchmany(%d)' % size, fetchmany, size, False) for size in FETCH_SIZES]
+    result.append(('iterate', iterate, None, False))
+    if serverSide:
+        result += [('named(%d)' % size, iterate, size, True) for size in FETCH_SIZES]
+    return result
+
+def fetchBenchSqlite(conn, ctx):
+    fetchBench(conn, ctx, 'SQLite', ways(), lambda size, named: conn.cursor(), (lambda: None))
+
+def fetchBenchPgsql(conn, ctx):
+    def cursor(size, named):
+        if not named:
+            return conn.cursor()
+        cur = conn.cursor('fetch')
+        cur.itersize = size
+        return cur
+
+    fetchBench(conn, ctx, 'Postgres', ways(True), cursor, conn.rollback)
+
+bench.register('fetch', sqlite = fetchBenchSqlite, pgsql = fetchBenchPgsql, fixture = True, params = ['scale'])
+
+if __name__ == '__main__':
+    import runner
+    runner.main(['fetch'] + sys.argv[1:])
@@ -0,0 +1,131 @@
+"""Pre-built datagen databases restored before each run of the workloads reading them.
+
+A fixture is keyed by SCHEMA_VERSION and the datagen settings (scale, seed, address count,
+Zipf exponent, and the SQLite page size since it cannot change once tables exist). It is
+built once and then restored instead of loading the data again:
+    SQLite    The fixture is a database file under --fixtures, copied over --db. A reflink
+              (copy on write clone) is used when the file system supports it. In-memory
+              databases (see storage.py) are loaded from it with the backup API.
+    Postgres  The fixture is a database used as the template of a freshly created testDb.
+A fixture is built under a temporary name and renamed when complete, so an interrupted build
+is never reused. Bump SCHEMA_VERSION when bench.createTable* changes.
+"""
+
+import os, re, time, shutil, fcntl
+import bench, results, datagen, storage
+
+SCHEMA_VERSION = 1
+# Batch size used to build fixtures. Generated data does not depend on it.
+BUILD_BATCH = 10000
+# ioctl of Linux cloning a file on file systems supporting reflinks (btrfs, xfs...).
+FICLONE = 0x40049409
+
+def key(ctx):
+    s = datagen.spec(ctx)
+    k = 'v%d-u%d-a%d-d%d-z%s-s%d' % (
+        SCHEMA_VERSION, s['users'], s['addresses'], s['departments'], s['zipf'], s['seed']
+    )
+    pageSize = (ctx.get('pragmas') or {}).get('page_size') if ctx['backend'] == 'sqlite' else None
+    if pageSize:
+        k += '-p%s' % pageSize
+    return k
+
+def copyFile(src, dst):
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+            return 'reflink'
+        except OSError:
+            pass
+    shutil.copyfile(src, dst)
+    return 'copy'
+
+def quietly(f):
+    # Building is not a measurement, keep datagen phases and settings out of the results.
+    reporting = bench.reporting
+    context = dict(results.context)
+    bench.reporting = False
+    try:
+        f()
+    finally:
+        bench.reporting = reporting
+        results.context = context
+
+def timed(title, f):
+    start = time.perf_counter()
+    how = f()
+    print('%s %.3f secs%s' % (title, time.perf_counter() - start, ' (%s)' % how if isinstance(how, str) else ''))
+
+def buildSqlite(ctx, path):
+    building = path + '.building'
+    bench.resetSqlite(building)
+    pageSize = (ctx.get('pragmas') or {}).get('page_size')
+
+    def load():
+        conn = bench.connectSqlite(building, None, pragmas = {'page_size': pageSize} if pageSize else None)
+        try:
+            datagen.loadSqlite(conn, dict(ctx, batch = BUILD_BATCH, txn = BUILD_BATCH))
+        finally:
+            conn.close()
+
+    quietly(load)
+    os.replace(building, path)
+
+def restoreSqlite(ctx):
+    path = os.path.join(ctx['fixtures'], 'fixture-%s.db' % key(ctx))
+    if not os.path.exists(path):
+        os.makedirs(ctx['fixtures'], exist_ok = True)
+        timed('build fixture %s' % path, lambda: buildSqlite(ctx, path))
+    if storage.inMemory(ctx):
+        timed('restore fixture %s to %s' % (path, ctx['db']), lambda: storage.load(path))
+        return
+    bench.resetSqlite(ctx['db'])
+    timed('restore fixture %s to %s' % (path, ctx['db']), lambda: copyFile(path, ctx['db']))
+
+def pgsqlName(ctx):
+    return 'fixture_' + re.sub('[^a-z0-9]', '_', key(ctx).lower())
+
+def withAdminConnection(f):
+    # CREATE/DROP DATABASE cannot run in a transaction nor while connected to the database.
+    conn = bench.connectPgsql('postgres')
+    conn.autocommit = True
+    try:
+        return f(conn.cursor())
+    finally:
+        conn.close()
+
+def databaseExists(cur, name):
+    cur.execute("select 1 from pg_database where datname = %s", (name, ))
+    return cur.fetchone() is not None
+
+def buildPgsql(ctx, name):
+    building = name + '_building'
+    withAdminConnection(lambda cur: (
+        cur.execute('drop database if exists "%s"' % building), cur.execute('create database "%s"' % building)
+    ))
+
+    def load():
+        conn = bench.connectPgsql(building)
+        try:
+            datagen.loadPgsql(conn, dict(ctx, batch = BUILD_BATCH, txn = BUILD_BATCH))
+        finally:
+            conn.close()
+
+    quietly(load)
+    withAdminConnection(lambda cur: cur.execute('alter database "%s" rename to "%s"' % (building, name)))
+
+def restorePgsql(ctx):
+    name = pgsqlName(ctx)
+    if not withAdminConnection(lambda cur: databaseExists(cur, name)):
+        timed('build fixture %s' % name, lambda: buildPgsql(ctx, name))
+    timed('restore fixture %s to testDb' % name, lambda: withAdminConnection(lambda cur: (
+        cur.execute('drop database if exists "testDb"'),
+        cur.execute('create database "testDb" template "%s"' % name)
+    )))
+
+def restore(ctx):
+    """Replace the benchmark database with the fixture of ctx, building it first if needed."""
+    if ctx['backend'] == 'sqlite':
+        restoreSqlite(ctx)
+    else:
+        restorePgsql(ctx)
@@ -1,73 +1,74 @@
 """Perform insert benchmark test.
 
-usage: insertBench.py [-h] [--wal] [--copy]
-
-options:
-    -h, --help  Show this help message and exit
-    --wal       Use WAL(Write a head log) instead of traditional rollback journal for SQLite.
-    --copy      USE COPY statement instead of insert statement for Postgres.
+Registers the 'insert' workload. Running this script is the same as 'runner.py insert'.
+Insert 100000 records by default, committing every 100 records (see --rows and --batch).
+Pass --copy to use COPY statement instead of insert statement for Postgres.
 """
 
-from docopt import docopt
-import io, datetime, bench
+import io, sys, datetime, bench, ioStats
+
+# Row data of a department passed to the database: its name and creation timestamp.
+ROW_BYTES = len('dept%08d' % 0) + len('2000-01-01 00:00:00')
 
-def insertDepartmentBench(conn, beginTranFunc, commitTranFunc, insertFunc):
-    cur = conn.cursor()
-    # Bulk insert 100 records at once.
-    indicies = range(1, 100000)
-    for chunk in [indicies[x:x+100] for x in range(1, len(indicies), 100)]:
-        beginTranFunc(cur)
-        insertFunc(cur, chunk)
-        commitTranFunc(cur)
+def insertDepartmentBench(conn, beginTranFunc, commitTranFunc, insertFunc, hist, ctx):
+    return bench.bulkUpdate(
+        conn, beginTranFunc, commitTranFunc, insertFunc, hist,
+        bench.param(ctx, 'rows', 100000), ctx['batch'],
+        bench.param(ctx, 'txn', ctx['batch'])
+    )
 
-def insertBenchSqlite(conn):
+def insertBenchSqlite(conn, ctx):
     def insertFunc(cur, chunk):
         cur.executemany(
             "insert into departments (department_name, created) values (?, CURRENT_TIMESTAMP)",
             map((lambda i: ("dept%08d" %i,)), chunk)
         )
+        ioStats.addLogical(len(chunk) * ROW_BYTES)
 
-    def performBench():
-        insertDepartmentBench(
-            conn, lambda cur: cur.execute('BEGIN TRANSACTION'), lambda cur: cur.execute('COMMIT'), insertFunc
+    def performBench(hist):
+        return insertDepartmentBench(
+            conn, lambda cur: cur.execute('BEGIN TRANSACTION'), lambda cur: cur.execute('COMMIT'), insertFunc, hist, ctx
         )
 
     bench.createTableSqlite(conn)
-    bench.withStopwatch("insert departments with SQLite", performBench)
+    bench.withLatency("insert departments with SQLite", performBench)
+
+def insertBenchPgsql(conn, ctx):
+    if ctx.get('copy'):
+        return copyInsertBenchPgsql(conn, ctx)
 
-def insertBenchPgsql(conn):
     def insertFunc(cur, chunk):
         cur.executemany(
             "insert into departments (department_name, created) values (%s, CURRENT_TIMESTAMP)",
             map((lambda i: ["dept%08d" %i]), chunk)
         )
+        ioStats.addLogical(len(chunk) * ROW_BYTES)
 
-    def performBench():
-        insertDepartmentBench(
-            conn, (lambda cur: None), lambda cur: conn.commit(), insertFunc
+    def performBench(hist):
+        return insertDepartmentBench(
+            conn, (lambda cur: None), lambda cur: conn.commit(), insertFunc, hist, ctx
         )
 
-    bench.withStopwatch("insert departments with Postgres", performBench)
+    bench.createTablePgsql(conn)
+    bench.withLatency("insert departments with Postgres", performBench)
 
-def copyInsertBenchPgsql(conn):
+def copyInsertBenchPgsql(conn, ctx):
     def insertFunc(cur, chunk):
         cur.copy_from(
             io.StringIO(''.join(map((lambda i: "dept%08d\t%s\n" % (i, datetime.datetime.now())), chunk))),
             'departments', columns=('department_name', 'created'))
+        ioStats.addLogical(len(chunk) * ROW_BYTES)
 
-    def performBench():
-        insertDepartmentBench(
-            conn, (lambda cur: None), lambda cur: conn.commit(), insertFunc
+    def performBench(hist):
+        return insertDepartmentBench(
+            conn, (lambda cur: None), lambda cur: conn.commit(), insertFunc, hist, ctx
         )
 
-    bench.withStopwatch("insert departments with Postgres using COPY", performBench)
+    bench.createTablePgsql(conn)
+    bench.withLatency("insert departments with Postgres using COPY", performBench)
+
+bench.register('insert', sqlite = insertBenchSqlite, pgsql = insertBenchPgsql, params = ['batch', 'txn'])
 
 if __name__ == '__main__':
-    args = docopt(__doc__)
-    # 'isolationLevel = None' means auto commit.
-    bench.withSqliteConnection("/tmp/test.db", insertBenchSqlite, isolationLevel = None, useWal = args["--wal"])
-    bench.withPgsqlConnection(bench.createTablePgsql)
-    if args["--copy"]:
-        bench.withPgsqlConnection(copyInsertBenchPgsql)
-    else:
-        bench.withPgsqlConnection(insertBenchPgsql)
+    import runner
+    runner.main(['insert'] + sys.argv[1:])
@@ -0,0 +1,167 @@
+"""I/O accounting of benchmark phases.
+
+When 'enabled' (runner --io), bench.withStopwatch records for every phase:
+    io_read_bytes, io_write_bytes  Bytes this process and its finished child processes read
+                                   from and dirtied for storage (/proc/self/io, getrusage()).
+    io_wchar, io_syscw             Bytes passed to write() and the like, and their calls.
+    pgsql_read_bytes, pgsql_write_bytes
+                                   The same for all processes of the Postgres server (backends,
+                                   WAL writer, checkpointer...), found from postmaster.pid of
+                                   the data directory (runner --pgdata). They must run as the
+                                   same user as the benchmark, as runbench.sh does.
+    file_growth_bytes              Size change of the database files: the SQLite database and its
+                                   -wal and -journal files, or the Postgres data directory.
+    device_write_bytes, device_flushes
+                                   Sectors written to and flush requests completed by the block
+                                   device holding the database (/sys/dev/block/*/stat, flushes
+                                   since Linux 5.5). These are device wide. Linux does not count
+                                   fsync() calls per process, so device flushes stand in for them.
+    write_amplification            Bytes written (this process and Postgres) per byte of row data
+                                   passed to addLogical() by the workload, where it does.
+"""
+
+import os, resource, threading
+
+enabled = False
+# Set by configure() for the run in progress.
+files = []
+pgdata = None
+lock = threading.Lock()
+logical = [0]
+
+SECTOR = 512
+
+def configure(paths, dataDirectory = None):
+    """Account the database files at 'paths', or the Postgres data directory."""
+    global pgdata
+    files[:] = [p for p in paths if p]
+    pgdata = dataDirectory
+
+def addLogical(nbytes):
+    with lock:
+        logical[0] += nbytes
+
+def procIo(pid = 'self'):
+    stats = {}
+    try:
+        with open('/proc/%s/io' % pid) as f:
+            for line in f:
+                name, value = line.split(':')
+                stats[name] = int(value)
+    except OSError:
+        pass
+    return stats
+
+def postgresPids():
+    try:
+        with open(os.path.join(pgdata, 'postmaster.pid')) as f:
+            postmaster = int(f.readline())
+    except (OSError, ValueError, TypeError):
+        return []
+    pids = [postmaster]
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open('/proc/%s/stat' % entry) as f:
+                # The command may contain spaces, the fields after it do not.
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == postmaster:
+            pids.append(int(entry))
+    return pids
+
+def directorySize(path):
+    total = 0
+    for root, dirs, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+def fileSize(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def deviceStat(path):
+    # Whole device rather than the partition, which has no flush counts on older kernels.
+    try:
+        st = os.stat(path)
+        device = os.path.realpath('/sys/dev/block/%d:%d' % (os.major(st.st_dev), os.minor(st.st_dev)))
+        if os.path.exists(os.path.join(device, 'partition')):
+            device = os.path.dirname(device)
+        with open(os.path.join(device, 'stat')) as f:
+            fields = [int(v) for v in f.read().split()]
+    except (OSError, ValueError):
+        return None
+    return {'sectors_written': fields[6], 'flushes': fields[15] if len(fields) > 15 else None}
+
+def snapshot():
+    s = procIo()
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    s['children_read_bytes'] = children.ru_inblock * SECTOR
+    s['children_write_bytes'] = children.ru_oublock * SECTOR
+    if pgdata:
+        server = [procIo(pid) for pid in postgresPids()]
+        s['pgsql_read_bytes'] = sum(p.get('read_bytes', 0) for p in server)
+        s['pgsql_write_bytes'] = sum(p.get('write_bytes', 0) for p in server)
+        s['file_size'] = directorySize(pgdata)
+        s['device'] = deviceStat(pgdata)
+    else:
+        s['file_size'] = sum(fileSize(p + suffix) for p in files for suffix in ('', '-wal', '-journal'))
+        existing = [p for p in files if os.path.exists(p)]
+        # In-memory databases have no device, whose other traffic would be counted instead.
+        s['device'] = deviceStat(existing[0] if existing else os.path.dirname(files[0])) if files else None
+    with lock:
+        s['logical'] = logical[0]
+    return s
+
+def begin():
+    return snapshot()
+
+def end(before):
+    """Return the I/O statistics of the phase started by begin()."""
+    after = snapshot()
+    delta = lambda k: after.get(k, 0) - before.get(k, 0)
+    stats = {
+        'io_read_bytes': delta('read_bytes') + delta('children_read_bytes'),
+        'io_write_bytes': delta('write_bytes') + delta('children_write_bytes'),
+        'io_wchar': delta('wchar'),
+        'io_syscw': delta('syscw'),
+        'file_growth_bytes': delta('file_size'),
+    }
+    written = stats['io_write_bytes']
+    if 'pgsql_write_bytes' in after:
+        stats['pgsql_read_bytes'] = delta('pgsql_read_bytes')
+        stats['pgsql_write_bytes'] = delta('pgsql_write_bytes')
+        written += stats['pgsql_write_bytes']
+    if before['device'] and after['device']:
+        stats['device_write_bytes'] = (after['device']['sectors_written'] - before['device']['sectors_written']) * SECTOR
+        if after['device']['flushes'] is not None:
+            stats['device_flushes'] = after['device']['flushes'] - before['device']['flushes']
+    if delta('logical') > 0:
+        stats['logical_bytes'] = delta('logical')
+        stats['write_amplification'] = written / delta('logical')
+    return stats
+
+def describe(title, stats):
+    parts = ['read=%.1fMB written=%.1fMB wchar=%.1fMB syscw=%d growth=%.1fMB' % (
+        stats['io_read_bytes'] / 1e6, stats['io_write_bytes'] / 1e6, stats['io_wchar'] / 1e6, stats['io_syscw'],
+        stats['file_growth_bytes'] / 1e6
+    )]
+    if 'pgsql_write_bytes' in stats:
+        parts.append('postgres read=%.1fMB written=%.1fMB' % (
+            stats['pgsql_read_bytes'] / 1e6, stats['pgsql_write_bytes'] / 1e6
+        ))
+    if 'device_write_bytes' in stats:
+        parts.append('device written=%.1fMB flushes=%s' % (
+            stats['device_write_bytes'] / 1e6, stats.get('device_flushes', 'n/a')
+        ))
+    if 'write_amplification' in stats:
+        parts.append('write amplification=%.2f' % stats['write_amplification'])
+    return '%s io: %s' % (title, ' '.join(parts))
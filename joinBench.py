@@ -0,0 +1,136 @@
+"""Perform join benchmark test.
+
+Registers the 'joins' workload. Running this script is the same as 'runner.py joins'.
+Runs joins over the datagen data (see --scale, restored from a fixture) 200 times each (see
+--iterations):
+    address users       addresses joined to their users for a range of addresses covering
+                        0.1%, 1% and 10% of them (selectivity). Users per address (fan-out)
+                        follows --addresses.
+    department members  A department joined to its users through user_department, for the
+                        largest, a middle and the smallest department (Zipf fan-out).
+    user departments    Users of an address left joined to their membership of one department.
+                        Unlike selectBench4, the department filter is in the join condition so
+                        that the join stays an outer join.
+All joins run first on the schema as created by bench.createTableCommon, which has no index
+on the foreign keys users.address_id and user_department.department_id, then again after
+creating them. The plan chosen for every join is captured with EXPLAIN QUERY PLAN (SQLite) or
+EXPLAIN (ANALYZE, BUFFERS) (Postgres) and stored as 'plan' next to the timing, so that
+'results.py compare' and 'results.py plans' can flag plans that changed.
+"""
+
+import sys, json, random, bench, latency, soak, datagen
+
+SELECTIVITY = [0.001, 0.01, 0.1]
+
+FK_INDEXES = [
+    ('users_address', 'users', 'address_id'),
+    ('user_department_department', 'user_department', 'department_id'),
+]
+
+ADDRESS_USERS = (
+    "select count(*), max(u.created) from addresses a inner join users u on u.address_id = a.address_id " +
+    "where a.address_id >= {p} and a.address_id < {p}"
+)
+DEPARTMENT_MEMBERS = (
+    "select count(*), max(u.created) from departments d " +
+    "inner join user_department ud on ud.department_id = d.department_id " +
+    "inner join users u on u.user_id = ud.user_id where d.department_id = {p}"
+)
+USER_DEPARTMENTS = (
+    "select count(u.user_id), count(d.department_id) from users u " +
+    "left join user_department ud on ud.user_id = u.user_id " +
+    "left join departments d on d.department_id = ud.department_id and d.department_name = {p} " +
+    "where u.address_id = {p}"
+)
+
+def joins(s):
+    """Return (title, sql template, args for iteration i) of every join to run."""
+    rnd = random.Random(0)
+    result = []
+    for selectivity in SELECTIVITY:
+        width = max(1, int(s['addresses'] * selectivity))
+        starts = [rnd.randint(1, max(1, s['addresses'] - width + 1)) for i in range(1000)]
+        result.append((
+            'address users (selectivity %g)' % selectivity, ADDRESS_USERS,
+            lambda i, starts = starts, width = width: (starts[i % len(starts)], starts[i % len(starts)] + width)
+        ))
+    for label, department in [
+        ('largest', 1), ('middle', max(1, s['departments'] // 10)), ('smallest', s['departments'])
+    ]:
+        result.append((
+            'department members (%s)' % label, DEPARTMENT_MEMBERS, lambda i, department = department: (department, )
+        ))
+    addresses = [rnd.randint(1, s['addresses']) for i in range(1000)]
+    result.append((
+        'user departments', USER_DEPARTMENTS,
+        lambda i: ('dept00000001', addresses[i % len(addresses)])
+    ))
+    return result
+
+def planSqlite(cur, sql, args):
+    cur.execute("explain query plan " + sql, args)
+    return {'plan': '; '.join(row[3] for row in cur.fetchall())}
+
+def planShape(node):
+    # Node types with their relation and index, without the costs that vary from run to run.
+    label = node['Node Type']
+    for key in ['Join Type', 'Relation Name', 'Index Name']:
+        if key in node:
+            label += ' ' + node[key]
+    children = node.get('Plans', [])
+    return label + ('(' + ', '.join(planShape(c) for c in children) + ')' if children else '')
+
+def planPgsql(cur, sql, args):
+    cur.execute("explain (analyze, buffers, format json) " + sql, args)
+    doc = cur.fetchone()[0]
+    plan = (json.loads(doc) if isinstance(doc, str) else doc)[0]['Plan']
+    return {
+        'plan': planShape(plan),
+        'shared_hit': plan.get('Shared Hit Blocks', 0),
+        'shared_read': plan.get('Shared Read Blocks', 0),
+    }
+
+def performJoins(conn, sql, argsFor, hist, n, endRead):
+    cur = conn.cursor()
+    for i in soak.repeat(n):
+        start = latency.now()
+        cur.execute(sql, argsFor(i))
+        cur.fetchall()
+        endRead()
+        hist.record(latency.now() - start)
+
+def joinBench(conn, ctx, backendName, placeholder, explain, endRead, commit):
+    s = datagen.spec(ctx)
+    n = bench.param(ctx, 'iterations', 200)
+    cur = conn.cursor()
+    for indexes in ['none', 'fk']:
+        if indexes == 'fk':
+            def createIndexes():
+                for name, table, column in FK_INDEXES:
+                    cur.execute("create index %s on %s (%s)" % (name, table, column))
+                commit()
+            bench.withStopwatch("create foreign key indexes with %s" % backendName, createIndexes)
+        cur.execute("analyze")
+        commit()
+        for name, template, argsFor in joins(s):
+            sql = template.format(p = placeholder)
+            title = "%s with %s indexes %s" % (name, backendName, indexes)
+            plan = explain(cur, sql, argsFor(0))
+            endRead()
+            hist = latency.Histogram(title)
+            r = bench.withStopwatch(title, lambda: performJoins(conn, sql, argsFor, hist, n, endRead), hist)
+            if r is not None:
+                r.update(plan)
+                print('%s plan: %s' % (title, plan['plan']))
+
+def joinBenchSqlite(conn, ctx):
+    joinBench(conn, ctx, 'SQLite', '?', planSqlite, (lambda: None), (lambda: None))
+
+def joinBenchPgsql(conn, ctx):
+    joinBench(conn, ctx, 'Postgres', '%s', planPgsql, conn.rollback, conn.commit)
+
+bench.register('joins', sqlite = joinBenchSqlite, pgsql = joinBenchPgsql, fixture = True, params = ['scale'])
+
+if __name__ == '__main__':
+    import runner
+    runner.main(['joins'] + sys.argv[1:])
@@ -0,0 +1,151 @@
+"""Per-operation latency recording.
+
+Latencies are measured with a monotonic nanosecond clock and kept in a
+fixed-bucket, log-linear (HDR style) histogram: values below 256ns are exact,
+larger values fall into buckets whose width is less than 1/128 of the value,
+so every reported percentile is within 0.8% of the real one.
+"""
+
+import time
+
+now = time.perf_counter_ns
+
+SUB_BITS = 8
+SUB_COUNT = 1 << SUB_BITS
+HALF_COUNT = SUB_COUNT >> 1
+# Largest trackable value is 2^44 ns (about 4.9 hours). Larger values are clamped.
+MAX_BITS = 44
+BUCKET_COUNT = (MAX_BITS - SUB_BITS) * HALF_COUNT + SUB_COUNT
+
+def bucketIndex(value):
+    if value < SUB_COUNT:
+        return value
+    shift = value.bit_length() - SUB_BITS
+    return min(shift * HALF_COUNT + (value >> shift), BUCKET_COUNT - 1)
+
+def bucketHighest(index):
+    if index < SUB_COUNT:
+        return index
+    shift = index // HALF_COUNT - 1
+    return ((index - shift * HALF_COUNT + 1) << shift) - 1
+
+class Histogram:
+    def __init__(self, title = None):
+        self.title = title
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, nanos):
+        self.counts[bucketIndex(nanos)] += 1
+        self.count += 1
+        self.total += nanos
+        if self.min is None or nanos < self.min:
+            self.min = nanos
+        if nanos > self.max:
+            self.max = nanos
+
+    def merge(self, other):
+        for i, c in enumerate(other.counts):
+            if c:
+                self.counts[i] += c
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+        return self
+
+    def copy(self):
+        h = Histogram(self.title)
+        h.counts = list(self.counts)
+        h.count = sum(h.counts)
+        h.total = self.total
+        h.min = self.min
+        h.max = self.max
+        return h
+
+    def since(self, earlier):
+        """Return a histogram of the samples recorded after 'earlier', a copy() of this one.
+        min and max are those of the buckets, not the exact values."""
+        h = Histogram(self.title)
+        h.counts = [a - b for a, b in zip(self.counts, earlier.counts)]
+        h.count = sum(h.counts)
+        h.total = self.total - earlier.total
+        used = [i for i, c in enumerate(h.counts) if c]
+        if used:
+            h.min = bucketHighest(used[0])
+            h.max = bucketHighest(used[-1])
+        return h
+
+    def percentile(self, p):
+        """Return the value (ns) at or below which p percent of the samples fall."""
+        if self.count == 0:
+            return 0
+        rank = max(1, -(-self.count * p // 100))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return min(bucketHighest(i), self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def summary(self, elapsed = None):
+        """Return a dict of the usual percentiles in milliseconds."""
+        s = {
+            'count': self.count,
+            'mean_ms': self.mean() / 1e6,
+            'p50_ms': self.percentile(50) / 1e6,
+            'p90_ms': self.percentile(90) / 1e6,
+            'p99_ms': self.percentile(99) / 1e6,
+            'p999_ms': self.percentile(99.9) / 1e6,
+            'max_ms': self.max / 1e6,
+        }
+        if elapsed:
+            s['ops_per_sec'] = self.count / elapsed
+        return s
+
+    def toDict(self):
+        """Sparse representation that can be pickled or written as JSON."""
+        return {
+            'title': self.title,
+            'counts': {i: c for i, c in enumerate(self.counts) if c},
+            'count': self.count, 'total': self.total, 'min': self.min, 'max': self.max
+        }
+
+    @classmethod
+    def fromDict(cls, d):
+        h = cls(d.get('title'))
+        for i, c in d['counts'].items():
+            h.counts[int(i)] = c
+        h.count = d['count']
+        h.total = d['total']
+        h.min = d['min']
+        h.max = d['max']
+        return h
+
+def timed(hist, func):
+    """Wrap func so that the latency of every call is recorded into hist."""
+    def wrapper(*args):
+        start = now()
+        try:
+            return func(*args)
+        finally:
+            hist.record(now() - start)
+    return wrapper
+
+def describe(title, hist, elapsed):
+    s = hist.summary(elapsed)
+    return (
+        '%s latency: n=%d mean=%.3fms p50=%.3fms p90=%.3fms p99=%.3fms p99.9=%.3fms max=%.3fms %.1f ops/sec' %
+        (title, s['count'], s['mean_ms'], s['p50_ms'], s['p90_ms'], s['p99_ms'], s['p999_ms'], s['max_ms'],
+         s.get('ops_per_sec', 0))
+    )
@@ -0,0 +1,166 @@
+"""Memory usage of the benchmark process, SQLite and the Postgres backends.
+
+Peak RSS comes from VmHWM of /proc/<pid>/status. It can be reset to the current RSS by writing
+5 to /proc/<pid>/clear_refs (Linux 4.0 and later), so that the peak of each phase is measured on
+its own. Where that is not possible the peak since process start from getrusage() is used.
+
+When 'enabled' (runner --memory), bench.withStopwatch reports for every phase:
+    peak_rss_mb, rss_growth_mb  Peak RSS of this process and its growth over the phase.
+    sqlite_*_mb                 SQLite's own allocator: memory in use at the end and its high
+                                water mark and page cache overflow during the phase, read with
+                                sqlite3_status64() through ctypes.
+    pgsql_backend_*_mb          RSS and peak RSS of the Postgres backends of the connections
+                                opened by bench.connectPgsql(), when the server runs on the same
+                                host. Postgres 9.3 has no pg_backend_memory_contexts view.
+    py_peak_mb, top_allocators  With 'tracing' (runner --tracemalloc) the peak of Python
+                                allocations and the source lines holding most of the memory
+                                still allocated at the end of the phase, at a considerable
+                                cost in speed.
+Phases running at the same time in several threads share one measurement started by the
+first of them, since RSS and tracemalloc are per process.
+"""
+
+import os, ctypes, resource, threading, tracemalloc
+
+enabled = False
+tracing = False
+TOP_ALLOCATORS = 5
+
+# Backend pids of the Postgres connections, see trackPgsql().
+backends = set()
+lock = threading.Lock()
+active = [0]
+
+SQLITE_STATUS_MEMORY_USED = 0
+SQLITE_STATUS_PAGECACHE_OVERFLOW = 2
+
+def loadSqlite():
+    # _sqlite3 is linked to the library holding the counters of the connections of this process.
+    try:
+        import _sqlite3
+        lib = ctypes.CDLL(_sqlite3.__file__)
+        lib.sqlite3_status64.argtypes = [
+            ctypes.c_int, ctypes.POINTER(ctypes.c_int64), ctypes.POINTER(ctypes.c_int64), ctypes.c_int
+        ]
+        return lib
+    except (ImportError, OSError, AttributeError):
+        return None
+
+sqliteLib = loadSqlite()
+
+def statusKb(field, pid = 'self'):
+    try:
+        with open('/proc/%s/status' % pid) as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def rss(pid = 'self'):
+    kb = statusKb('VmRSS', pid)
+    return kb * 1024 if kb is not None else None
+
+def resetPeak(pid = 'self'):
+    """Reset the peak RSS to the current RSS. Returns False if the peak cannot be reset."""
+    try:
+        with open('/proc/%s/clear_refs' % pid, 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def peakRss(pid = 'self'):
+    kb = statusKb('VmHWM', pid)
+    if kb is None and pid == 'self':
+        # Kilobytes on Linux.
+        kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return kb * 1024 if kb is not None else None
+
+def measurePeak(f):
+    """Run f() and return (its result, peak RSS in bytes while it ran, RSS before it ran)."""
+    before = rss()
+    resetPeak()
+    ret = f()
+    return ret, peakRss(), before
+
+def sqliteStatus(op, reset = False):
+    current, highwater = ctypes.c_int64(), ctypes.c_int64()
+    if sqliteLib is None or sqliteLib.sqlite3_status64(op, ctypes.byref(current), ctypes.byref(highwater), int(reset)):
+        return None, None
+    return current.value, highwater.value
+
+def trackPgsql(conn):
+    if not enabled:
+        return
+    cur = conn.cursor()
+    cur.execute("select pg_backend_pid()")
+    pid = cur.fetchone()[0]
+    conn.rollback()
+    with lock:
+        backends.add(pid)
+
+def liveBackends():
+    with lock:
+        backends.intersection_update(pid for pid in list(backends) if os.path.exists('/proc/%d' % pid))
+        return list(backends)
+
+def begin():
+    """Start measuring a phase. Returns the state to pass to end()."""
+    state = {'rss': rss()}
+    with lock:
+        active[0] += 1
+        if active[0] > 1:
+            return state
+    resetPeak()
+    for op in [SQLITE_STATUS_MEMORY_USED, SQLITE_STATUS_PAGECACHE_OVERFLOW]:
+        sqliteStatus(op, reset = True)
+    for pid in liveBackends():
+        resetPeak(pid)
+    if tracing:
+        tracemalloc.start()
+        tracemalloc.clear_traces()
+        tracemalloc.reset_peak()
+    return state
+
+def mb(n):
+    return n / 1e6 if n is not None else None
+
+def end(state):
+    """Return the memory statistics of the phase started by begin()."""
+    peak = peakRss()
+    stats = {
+        'peak_rss_mb': mb(peak),
+        'rss_growth_mb': mb(peak - state['rss']) if peak is not None and state['rss'] is not None else None,
+    }
+    used, highwater = sqliteStatus(SQLITE_STATUS_MEMORY_USED)
+    stats['sqlite_memory_used_mb'] = mb(used)
+    stats['sqlite_memory_highwater_mb'] = mb(highwater)
+    stats['sqlite_pagecache_overflow_mb'] = mb(sqliteStatus(SQLITE_STATUS_PAGECACHE_OVERFLOW)[1])
+    pids = liveBackends()
+    if pids:
+        stats['pgsql_backend_rss_mb'] = mb(sum(rss(pid) or 0 for pid in pids))
+        stats['pgsql_backend_peak_mb'] = mb(max(peakRss(pid) or 0 for pid in pids))
+    with lock:
+        active[0] -= 1
+        last = active[0] == 0
+    if tracing and tracemalloc.is_tracing():
+        stats['py_peak_mb'] = mb(tracemalloc.get_traced_memory()[1])
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, tracemalloc.__file__)
+        ])
+        top = snapshot.statistics('lineno')[:TOP_ALLOCATORS]
+        stats['top_allocators'] = '; '.join(
+            '%s:%d=%.1fKB' % (os.path.basename(s.traceback[0].filename), s.traceback[0].lineno, s.size / 1024)
+            for s in top
+        )
+        if last:
+            tracemalloc.stop()
+    return dict((k, v) for k, v in stats.items() if v is not None)
+
+def describe(title, stats):
+    parts = ['%s=%.1fMB' % (k[:-3], v) for k, v in stats.items() if k.endswith('_mb')]
+    if 'top_allocators' in stats:
+        parts.append('top: %s' % stats['top_allocators'])
+    return '%s memory: %s' % (title, ' '.join(parts))
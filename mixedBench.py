@@ -0,0 +1,263 @@
+"""Perform mixed read/write benchmark test.
+
+Registers the 'mixed' workload. Running this script is the same as 'runner.py mixed'.
+Clients (see --clients) run 5000 operations each (see --iterations) at the same time against
+the datagen data (see --scale, restored from a fixture). --read-ratio percent of them are
+primary key lookups of users, the others update one user in a transaction of its own (started
+as --begin on SQLite), keys drawn from --distribution (see readBench.py). Reads and writes get histograms of their own.
+With --result-cache the lookups go through a result cache shared by the clients, which writes
+invalidate or not (see resultCache.py), and its hit rate and staleness are reported with the
+reads.
+
+On SQLite in WAL mode (see --wal) the WAL file size is sampled every SAMPLE_INTERVAL seconds
+and checkpoints follow --checkpoint:
+    auto      SQLite checkpoints (PASSIVE) whenever a commit leaves the WAL over
+              wal_autocheckpoint pages, on the committing connection. These checkpoints
+              are not seen here but in the write latency.
+    manual    No checkpoint while the clients run, so the WAL grows with every write. One
+              TRUNCATE checkpoint at the end shows what it costs to catch up.
+    passive   A thread of its own runs wal_checkpoint(PASSIVE) every CHECKPOINT_INTERVAL
+    full      seconds (a tenth of --duration if shorter), wal_checkpoint(FULL) or
+    truncate  wal_checkpoint(TRUNCATE) likewise, and once more when the clients finished.
+              FULL and TRUNCATE wait for readers and block writers while they run.
+Every checkpoint run here is timed, and the WAL size and checkpoints of every second, or of
+every tenth of runs shorter than 10 seconds, are printed as a timeline and stored as
+'wal_timeline' next to the timings. The WAL size when the clients finished is reported as
+wal_final_mb.
+"""
+
+import os, sys, time, random, threading, bench, latency, retry, results, timeseries, soak, datagen, readBench
+import resultCache
+
+CHECKPOINTS = ('auto', 'manual', 'passive', 'full', 'truncate')
+SAMPLE_INTERVAL = 0.1
+CHECKPOINT_INTERVAL = 1.0
+USER_BY_ID = "select * from users where user_id = %s"
+
+def readSqlite(conn, key):
+    cur = conn.cursor()
+    cur.execute(USER_BY_ID.replace('%s', '?'), (key, ))
+    return cur.fetchall()
+
+def writeSqlite(conn, key, i, committed):
+    # Started as --begin says, the update is the only statement so deferred does not deadlock.
+    retry.transaction(conn, lambda cur: cur.execute(
+        "update users set first_name = ? where user_id = ?", ("fname%08d" % i, key)
+    ), committed = committed)
+
+def readPgsql(conn, key):
+    cur = conn.cursor()
+    cur.execute(USER_BY_ID, (key, ))
+    rows = cur.fetchall()
+    conn.rollback()
+    return rows
+
+def writePgsql(conn, key, i, committed):
+    conn.cursor().execute("update users set first_name = %s where user_id = %s", ("fname%08d" % i, key))
+    conn.commit()
+    if committed:
+        committed()
+
+class WalMonitor:
+    """Samples the WAL file size and runs and times checkpoints while the clients run."""
+    def __init__(self, ctx, policy):
+        self.path = ctx['db'] + '-wal'
+        self.ctx = ctx
+        self.policy = policy
+        self.samples = []
+        self.checkpoints = []
+        self.hist = latency.Histogram()
+        self.stopped = threading.Event()
+        self.threads = []
+
+    def walSize(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def sample(self):
+        while not self.stopped.is_set():
+            self.samples.append((time.perf_counter() - self.start, self.walSize()))
+            self.stopped.wait(SAMPLE_INTERVAL)
+
+    def checkpoint(self, conn, mode):
+        start = latency.now()
+        busy, log, checkpointed = conn.execute("pragma wal_checkpoint(%s)" % mode).fetchone()
+        elapsed = latency.now() - start
+        self.hist.record(elapsed)
+        self.checkpoints.append((
+            (start - self.startNs) / 1e9, elapsed / 1e6, busy, log, checkpointed
+        ))
+        timeseries.mark('checkpoint', '%s %.3fms busy=%d log=%d checkpointed=%d' % (
+            mode, elapsed / 1e6, busy, log, checkpointed
+        ))
+
+    def checkpointer(self):
+        conn = bench.connect(self.ctx)
+        try:
+            interval = min(CHECKPOINT_INTERVAL, soak.duration / 10) if soak.duration else CHECKPOINT_INTERVAL
+            while not self.stopped.wait(interval):
+                self.checkpoint(conn, self.policy.upper())
+        finally:
+            conn.close()
+
+    def begin(self):
+        # Held until the end, so that the last client closing does not checkpoint the WAL.
+        self.conn = bench.connect(self.ctx)
+        self.start = time.perf_counter()
+        self.startNs = latency.now()
+        self.threads = [threading.Thread(target = self.sample)]
+        if self.policy in ('passive', 'full', 'truncate'):
+            self.threads.append(threading.Thread(target = self.checkpointer))
+        for t in self.threads:
+            t.start()
+
+    def end(self):
+        self.stopped.set()
+        for t in self.threads:
+            t.join()
+        self.samples.append((time.perf_counter() - self.start, self.walSize()))
+        try:
+            if self.policy == 'manual':
+                self.checkpoint(self.conn, 'TRUNCATE')
+            elif self.policy in ('passive', 'full', 'truncate'):
+                # Runs shorter than the interval would not see one otherwise.
+                self.checkpoint(self.conn, self.policy.upper())
+        finally:
+            self.conn.close()
+        self.samples.append((time.perf_counter() - self.start, self.walSize()))
+
+    def timeline(self):
+        """Return (start in seconds, max WAL size in MB, number of checkpoints) of every second,
+        or of every tenth of the run if it was shorter than 10 seconds."""
+        step = min(1.0, max(SAMPLE_INTERVAL, self.samples[-1][0] / 10))
+        slots = {}
+        for t, size in self.samples:
+            s = slots.setdefault(int(t / step), [0, 0])
+            s[0] = max(s[0], size / 1e6)
+        for t, ms, busy, log, checkpointed in self.checkpoints:
+            slots.setdefault(int(t / step), [0, 0])[1] += 1
+        return [(i * step, mb, n) for i, (mb, n) in sorted(slots.items())]
+
+    def summary(self):
+        sizes = [size for t, size in self.samples]
+        r = {
+            'wal_max_mb': max(sizes) / 1e6,
+            'wal_final_mb': sizes[-2] / 1e6,
+            'checkpoints': len(self.checkpoints),
+            'checkpoint_busy': sum(1 for c in self.checkpoints if c[2]),
+            'wal_timeline': ' '.join('%.1f:%.2f/%d' % point for point in self.timeline()),
+        }
+        if self.hist.count:
+            r['checkpoint_p99_ms'] = self.hist.percentile(99) / 1e6
+            r['checkpoint_max_ms'] = self.hist.max / 1e6
+        return r
+
+def journalMode(ctx):
+    conn = bench.connect(ctx)
+    try:
+        return conn.execute("pragma journal_mode").fetchone()[0].lower()
+    finally:
+        conn.close()
+
+def mixedBench(ctx):
+    ratio = bench.param(ctx, 'read_ratio', 95)
+    clients = bench.param(ctx, 'clients', 4)
+    n = bench.param(ctx, 'iterations', 5000)
+    s = datagen.spec(ctx)
+    distribution = bench.param(ctx, 'distribution', 'uniform')
+    cache = resultCache.create(ctx)
+    if ctx['backend'] == 'sqlite':
+        read, write = retry.retrying(readSqlite), writeSqlite
+        policy = bench.param(ctx, 'checkpoint', 'auto')
+        wal = journalMode(ctx) == 'wal'
+    else:
+        read, write = readPgsql, writePgsql
+        policy, wal = None, False
+
+    readHist = latency.Histogram()
+    writeHist = latency.Histogram()
+    lock = threading.Lock()
+
+    def client(index):
+        rnd = random.Random(index)
+        keys = readBench.keys(distribution, n, s['users'], s['zipf'], index)
+        reads, writes = latency.Histogram(), latency.Histogram()
+        # Invalidates as soon as the write committed, timed from then rather than after the write returned.
+        written = (lambda: cache.written(('users', ), time.monotonic())) if cache else None
+        bench.track(reads, 'client %d reads' % index)
+        bench.track(writes, 'client %d writes' % index)
+        conn = bench.connect(ctx)
+        if policy not in (None, 'auto'):
+            conn.execute("pragma wal_autocheckpoint = 0")
+        try:
+            for j, i in enumerate(soak.repeat(n, index * n)):
+                key = keys[j % n]
+                start = latency.now()
+                if rnd.random() * 100 < ratio:
+                    if cache:
+                        cache.fetch(USER_BY_ID, (key, ), ('users', ), lambda: read(conn, key))
+                    else:
+                        read(conn, key)
+                    reads.record(latency.now() - start)
+                else:
+                    write(conn, key, i, written)
+                    writes.record(latency.now() - start)
+        finally:
+            conn.close()
+            with lock:
+                readHist.merge(reads)
+                writeHist.merge(writes)
+
+    monitor = WalMonitor(ctx, policy) if wal else None
+    elapsed = []
+
+    def perform():
+        start = time.perf_counter()
+        if monitor:
+            monitor.begin()
+        threads = [threading.Thread(target = client, args = (i, )) for i in range(clients)]
+        try:
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            if monitor:
+                monitor.end()
+        elapsed.append(time.perf_counter() - soak.measuredFrom(start))
+
+    title = "%s %d%% reads with %d clients" % (ctx['backend'], ratio, clients)
+    if distribution != 'uniform':
+        title += " %s keys" % distribution
+    if policy:
+        title += " checkpoint %s" % (policy if wal else 'n/a (no WAL)')
+    r = bench.withStopwatch(title, perform)
+    if not bench.reporting:
+        return
+    for op, hist in [('reads', readHist), ('writes', writeHist)]:
+        if hist.count:
+            # Throughput is over the wall-clock time of all clients.
+            opTitle = "%s %s" % (title, op)
+            opRecord = results.record(opTitle, elapsed[0], hist)
+            print(latency.describe(opTitle, hist, elapsed[0]))
+            if op == 'reads':
+                resultCache.report(opTitle, cache, opRecord)
+    if monitor:
+        r.update(monitor.summary())
+        print('%s WAL: max=%.1fMB final=%.1fMB checkpoints=%d busy=%d' % (
+            title, r['wal_max_mb'], r['wal_final_mb'], r['checkpoints'], r['checkpoint_busy']
+        ))
+        if 'checkpoint_p99_ms' in r:
+            print('%s checkpoint: p99=%.3fms max=%.3fms' % (title, r['checkpoint_p99_ms'], r['checkpoint_max_ms']))
+        print('%s WAL timeline (seconds:MB/checkpoints): %s' % (title, r['wal_timeline']))
+
+bench.register(
+    'mixed', sqlite = mixedBench, pgsql = mixedBench, perConnection = False, fixture = True,
+    params = ['clients', 'distribution', 'read_ratio', 'checkpoint', 'retry', 'begin', 'scale', 'result_cache']
+)
+
+if __name__ == '__main__':
+    import runner
+    runner.main(['mixed'] + sys.argv[1:])
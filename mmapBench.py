@@ -0,0 +1,114 @@
+"""Perform memory-mapped I/O benchmark test.
+
+Registers the 'mmap' workload (SQLite only). Running this script is the same as 'runner.py mmap'.
+Reads the datagen data (see --scale, restored from a fixture) on a connection with mmap_size
+set to
+    off      0, pages are read() into SQLite's page cache.
+    partial  Half the size of the database file.
+    full     The size of the database file. SQLite caps mmap_size at SQLITE_MAX_MMAP_SIZE,
+             about 2GB unless compiled otherwise, so larger databases are mapped in part
+             whatever is asked. The size in effect is reported as mmap_mb.
+The reads are point lookups of users by primary key and by user_name, 10000 times each (see
+--iterations) and the joins of selectBench3 (users of an address) and selectBench4 (users of an
+address in a department), 1/100 as many times. Every phase reports minor and major page faults
+(getrusage) and the peak RSS of the benchmark process, which counts mapped pages it touched,
+with the database size and the RAM of the host. Sweep --scale from below RAM to above it to
+see where mmap stops paying, e.g. --scale=10,1000,50000 --output=mmap.json.
+"""
+
+import os, sys, random, resource, bench, latency, soak, datagen, memory, storage, cacheState, readBench
+
+MODES = ('off', 'partial', 'full')
+
+QUERIES = [
+    ('users by primary key', "select * from users where user_id = ?", 1),
+    ('users by user_name', "select * from users where user_name = ?", 1),
+    (
+        'users of an address',
+        "select count(*) from users u inner join addresses a on u.address_id = a.address_id where address = ?",
+        100
+    ),
+    (
+        'users of an address in a department',
+        "select count(u.user_id) from users u " +
+        "inner join addresses a on u.address_id = a.address_id " +
+        "left join user_department ud on u.user_id = ud.user_id " +
+        "inner join departments d on ud.department_id = d.department_id " +
+        "where (d.department_name = ? or d.department_name is null) and address = ?",
+        100
+    ),
+]
+
+def argsFor(name, s, keyList):
+    rnd = random.Random(0)
+    departments = [rnd.randint(1, s['departments']) for i in range(len(keyList))]
+    addresses = [rnd.randint(1, s['addresses']) for i in range(len(keyList))]
+    if name == 'users by primary key':
+        return lambda i: (keyList[i], )
+    if name == 'users by user_name':
+        return lambda i: ('user%08d' % keyList[i], )
+    if name == 'users of an address':
+        return lambda i: ('addr%08d' % addresses[i], )
+    return lambda i: ('dept%08d' % departments[i], 'addr%08d' % addresses[i])
+
+def mmapSize(mode, dbSize):
+    return {'off': 0, 'partial': dbSize // 2, 'full': dbSize}[mode]
+
+def ramSize():
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+def performQueries(conn, sql, argsFor, n, hist, faults):
+    def perform():
+        cur = conn.cursor()
+        for i in soak.repeat(n):
+            start = latency.now()
+            cur.execute(sql, argsFor(i % n))
+            cur.fetchall()
+            hist.record(latency.now() - start)
+
+    before = resource.getrusage(resource.RUSAGE_SELF)
+    faults['peak'], faults['before'] = memory.measurePeak(perform)[1:]
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    faults['minor'] = after.ru_minflt - before.ru_minflt
+    faults['major'] = after.ru_majflt - before.ru_majflt
+
+def mmapBench(ctx):
+    if storage.inMemory(ctx):
+        print('mmap needs a database file, skipped for %s storage.' % ctx['storage'])
+        return
+    s = datagen.spec(ctx)
+    n = bench.param(ctx, 'iterations', 10000)
+    dbSize = os.path.getsize(ctx['db'])
+    ram = ramSize()
+    print('Database %.1fMB, RAM %.1fMB' % (dbSize / 1e6, ram / 1e6))
+    for mode in MODES:
+        modeCtx = dict(ctx, pragmas = dict(ctx.get('pragmas') or {}, mmap_size = mmapSize(mode, dbSize)))
+        conn = bench.connect(modeCtx)
+        try:
+            mapped = conn.execute("pragma mmap_size").fetchone()[0]
+            for name, sql, divisor in QUERIES:
+                count = max(1, n // divisor)
+                keyList = readBench.keys('uniform', count, s['users'], s['zipf'])
+                args = argsFor(name, s, keyList)
+                faults = {}
+                title = "%s with SQLite mmap %s" % (name, mode)
+                r = cacheState.withLatency(
+                    title, conn, modeCtx, lambda conn, hist: performQueries(conn, sql, args, count, hist, faults)
+                )
+                if r is not None:
+                    r.update(
+                        mmap_mode = mode, mmap_mb = mapped / 1e6, db_mb = dbSize / 1e6, ram_mb = ram / 1e6,
+                        minor_faults = faults['minor'], major_faults = faults['major'],
+                        peak_rss_mb = faults['peak'] / 1e6, rss_growth_mb = (faults['peak'] - faults['before']) / 1e6
+                    )
+                    print('%s mmap=%.1fMB faults minor=%d major=%d peak RSS %.1fMB (+%.1fMB)' % (
+                        title, r['mmap_mb'], r['minor_faults'], r['major_faults'], r['peak_rss_mb'], r['rss_growth_mb']
+                    ))
+        finally:
+            conn.close()
+
+bench.register('mmap', sqlite = mmapBench, perConnection = False, fixture = True, params = ['cache', 'scale'])
+
+if __name__ == '__main__':
+    import runner
+    runner.main(['mmap'] + sys.argv[1:])
@@ -0,0 +1,93 @@
+"""Open-loop load generation with asyncio.
+
+Operations are issued at a fixed target rate regardless of how long the previous ones take,
+either evenly spaced (constant) or with exponentially distributed gaps (poisson). Each operation
+runs on a bounded pool of executor threads, each with its own connection. Latency is measured
+from the time the operation was due, not from the time it actually started, so the time spent
+queued behind slow operations is not hidden (coordinated omission). The time spent executing
+is recorded separately as service time.
+"""
+
+import asyncio, random, threading, concurrent.futures
+import latency, soak
+
+ARRIVALS = ('constant', 'poisson')
+
+def schedule(rate, n, arrival = 'constant', seed = 0):
+    # Offsets in nanos from the start at which each operation is due.
+    if arrival == 'constant':
+        for i in range(n):
+            yield int(i * 1e9 / rate)
+    elif arrival == 'poisson':
+        rnd = random.Random(seed)
+        t = 0.0
+        for i in range(n):
+            yield int(t * 1e9)
+            t += rnd.expovariate(rate)
+    else:
+        raise ValueError('Unknown arrival: %s (known: %s)' % (arrival, ', '.join(ARRIVALS)))
+
+class Driver:
+    def __init__(self, connect, workers):
+        self.connect = connect
+        self.workers = workers
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+        # Response time from the due time, and service time from the actual start.
+        self.hist = latency.Histogram()
+        self.service = latency.Histogram()
+        self.late = 0
+
+    def connection(self):
+        if not hasattr(self.local, 'conn'):
+            self.local.conn = self.connect()
+            with self.lock:
+                self.connections.append(self.local.conn)
+        return self.local.conn
+
+    def call(self, operation, i):
+        conn = self.connection()
+        start = latency.now()
+        operation(conn, i)
+        return start, latency.now()
+
+    async def drive(self, executor, operation, offsets):
+        loop = asyncio.get_running_loop()
+        base = latency.now()
+        pending = []
+
+        def done(due, f):
+            start, end = f.result()
+            self.hist.record(end - due)
+            self.service.record(end - start)
+            # Started more than 1ms after it was due, i.e. queued behind other operations.
+            if start > due + 1000000 and soak.measuring():
+                self.late += 1
+
+        for i, offset in enumerate(offsets):
+            due = base + offset
+            wait = due - latency.now()
+            if wait > 0:
+                await asyncio.sleep(wait / 1e9)
+            f = loop.run_in_executor(executor, self.call, operation, i)
+            f.add_done_callback(lambda f, due = due: done(due, f))
+            pending.append(f)
+        await asyncio.gather(*pending)
+
+    def run(self, operation, offsets):
+        """Run operation(conn, i) for every offset and wait for all of them to finish."""
+        with concurrent.futures.ThreadPoolExecutor(max_workers = self.workers) as executor:
+            asyncio.run(self.drive(executor, operation, offsets))
+
+    def close(self):
+        for conn in self.connections:
+            conn.close()
+        self.connections = []
+
+    def summary(self):
+        return {
+            'service_p50_ms': self.service.percentile(50) / 1e6,
+            'service_p99_ms': self.service.percentile(99) / 1e6,
+            'late_ops': self.late,
+        }
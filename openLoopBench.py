@@ -0,0 +1,65 @@
+"""Perform open-loop query benchmark test.
+
+Registers the 'open-loop' workload. Running this script is the same as 'runner.py open-loop'.
+Primary key lookups of users of the datagen data (see --scale, restored from a fixture) are
+issued 5000 times (see --iterations) at a target rate (see --rate) with constant or poisson
+arrivals (see --arrival), on --clients executor threads. Latency is measured from the time
+each lookup was due, so sweeping --rate gives latency against offered load. Postgres lookups
+run on the same thread pool since psycopg2 has no asyncio support.
+"""
+
+import sys, random, bench, openLoop, soak, datagen
+
+def lookupSqlite(conn, key):
+    cur = conn.cursor()
+    cur.execute("select user_name from users where user_id = ?", (key,))
+    cur.fetchone()
+
+def lookupPgsql(conn, key):
+    cur = conn.cursor()
+    cur.execute("select user_name from users where user_id = %s", (key,))
+    cur.fetchone()
+    conn.rollback()
+
+# Keys drawn up front, reused in turn by longer runs.
+KEYS = 100000
+
+def openLoopBench(ctx):
+    rate = bench.param(ctx, 'rate', 1000)
+    arrival = bench.param(ctx, 'arrival', 'constant')
+    workers = bench.param(ctx, 'clients', 4)
+    rows = datagen.spec(ctx)['users']
+    n = bench.param(ctx, 'iterations', 5000)
+    if soak.duration is not None:
+        # Enough operations to last the phase, cut at its deadline.
+        n = int(rate * (soak.warmup + soak.duration)) + 1
+    lookup = lookupSqlite if ctx['backend'] == 'sqlite' else lookupPgsql
+
+    rnd = random.Random(0)
+    keys = [rnd.randint(1, rows) for i in range(min(n, KEYS))]
+    driver = openLoop.Driver(lambda: bench.connect(ctx), workers)
+    title = "%s lookups at %d/sec %s arrivals with %d clients" % (ctx['backend'], rate, arrival, workers)
+
+    def perform():
+        soak.track(driver.service)
+        offsets = (offset for i, offset in zip(soak.repeat(n), openLoop.schedule(rate, n, arrival)))
+        driver.run(lambda conn, i: lookup(conn, keys[i % len(keys)]), offsets)
+
+    try:
+        r = bench.withStopwatch(title, perform, driver.hist)
+    finally:
+        driver.close()
+    if r is not None:
+        r.update(driver.summary())
+        print('%s offered %d ops/sec achieved %.1f ops/sec service p50=%.3fms p99=%.3fms late=%d' % (
+            title, rate, r['ops_per_sec'], r['service_p50_ms'], r['service_p99_ms'], r['late_ops']
+        ))
+
+bench.register(
+    'open-loop', sqlite = openLoopBench, pgsql = openLoopBench, perConnection = False, fixture = True,
+    params = ['rate', 'arrival', 'clients', 'scale']
+)
+
+if __name__ == '__main__':
+    import runner
+    runner.main(['open-loop'] + sys.argv[1:])
@@ -0,0 +1,98 @@
+"""A minimal connection pool for the SQLite and Postgres backends.
+
+Connections are created on demand up to 'size'. A released connection is kept idle and handed
+out again by the next acquire(); connections idle for longer than 'idleTimeout' seconds are
+closed instead of being reused. 'setup' is called on every checkout, e.g. to apply pragmas.
+"""
+
+import threading, time, collections
+import latency
+
+class Pool:
+    def __init__(self, connect, size, idleTimeout = None, setup = None):
+        self.connect = connect
+        self.size = size
+        self.idleTimeout = idleTimeout
+        self.setup = setup
+        self.idle = collections.deque()
+        self.lock = threading.Lock()
+        self.available = threading.Semaphore(size)
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+        # Time spent waiting for a free slot when all connections are checked out.
+        self.waits = latency.Histogram()
+
+    def acquire(self):
+        start = latency.now()
+        self.available.acquire()
+        waited = latency.now() - start
+        with self.lock:
+            self.waits.record(waited)
+            conn = self.takeIdle()
+        new = conn is None
+        try:
+            if new:
+                conn = self.connect()
+                with self.lock:
+                    self.created += 1
+            if self.setup:
+                self.setup(conn)
+            return conn
+        except Exception:
+            if conn is not None:
+                # A connection failing its setup is not handed out again.
+                conn.close()
+                with self.lock:
+                    if new:
+                        self.created -= 1
+                    else:
+                        self.reused -= 1
+            self.available.release()
+            raise
+
+    def takeIdle(self):
+        # Called with the lock held. Most recently used connections are taken first so that
+        # the ones at the other end of the deque can expire.
+        now = time.monotonic()
+        while self.idle:
+            conn, since = self.idle.pop()
+            if self.idleTimeout is None or now - since <= self.idleTimeout:
+                self.reused += 1
+                if self.idleTimeout is not None:
+                    self.evictExpired(now)
+                return conn
+            conn.close()
+            self.evicted += 1
+        return None
+
+    def evictExpired(self, now):
+        while self.idle and now - self.idle[0][1] > self.idleTimeout:
+            self.idle.popleft()[0].close()
+            self.evicted += 1
+
+    def release(self, conn):
+        with self.lock:
+            self.idle.append((conn, time.monotonic()))
+        self.available.release()
+
+    def withConnection(self, f):
+        conn = self.acquire()
+        try:
+            return f(conn)
+        finally:
+            self.release(conn)
+
+    def close(self):
+        with self.lock:
+            while self.idle:
+                self.idle.pop()[0].close()
+
+    def summary(self):
+        return {
+            'pool_created': self.created,
+            'pool_reused': self.reused,
+            'pool_evicted': self.evicted,
+            'pool_wait_p99_ms': self.waits.percentile(99) / 1e6,
+            'pool_wait_max_ms': self.waits.max / 1e6,
+        }
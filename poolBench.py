@@ -0,0 +1,133 @@
+"""Perform connection handling benchmark test.
+
+Registers the 'pool' workload. Running this script is the same as 'runner.py pool'.
+Clients (see --clients) run short transactions, a primary key lookup of one of 1000 departments
+(see --rows) followed by an insert into addresses, 2000 times each (see --iterations).
+Connections are handled in one of these ways (see --connection):
+    held         Each client opens one connection and keeps it for the whole run.
+    pooled       Each transaction borrows a connection from a pool (see --pool-size and
+                 --pool-idle). SQLite pragmas are applied on every checkout.
+    per-request  Each transaction opens and closes its own connection.
+"""
+
+import sys, random, threading, bench, latency, pool, retry, soak, pragmas as sqlitePragmas
+
+def populateSqlite(conn, rows):
+    bench.createTableSqlite(conn)
+    cur = conn.cursor()
+    cur.execute('BEGIN TRANSACTION')
+    cur.executemany(
+        "insert into departments (department_name, created) values (?, CURRENT_TIMESTAMP)",
+        map((lambda i: ("dept%08d" %i,)), range(1, rows + 1))
+    )
+    cur.execute('COMMIT')
+
+def populatePgsql(conn, rows):
+    bench.createTablePgsql(conn)
+    cur = conn.cursor()
+    cur.executemany(
+        "insert into departments (department_name, created) values (%s, CURRENT_TIMESTAMP)",
+        map((lambda i: ("dept%08d" %i,)), range(1, rows + 1))
+    )
+    conn.commit()
+
+def transactionSqlite(conn, key, i):
+    def work(cur):
+        cur.execute("select department_name from departments where department_id = ?", (key,))
+        cur.fetchone()
+        cur.execute("insert into addresses (address) values (?)", ("addr%08d" % i,))
+    # Read then write, so a deferred transaction would deadlock on the lock upgrade.
+    retry.transaction(conn, work, 'immediate')
+
+def transactionPgsql(conn, key, i):
+    cur = conn.cursor()
+    cur.execute("select department_name from departments where department_id = %s", (key,))
+    cur.fetchone()
+    cur.execute("insert into addresses (address) values (%s)", ("addr%08d" % i,))
+    conn.commit()
+
+def withNewConnection(ctx, f):
+    conn = bench.connect(ctx)
+    try:
+        return f(conn)
+    finally:
+        conn.close()
+
+def poolBench(ctx):
+    mode = bench.param(ctx, 'connection', 'pooled')
+    clients = bench.param(ctx, 'clients', 4)
+    rows = bench.param(ctx, 'rows', 1000)
+    n = bench.param(ctx, 'iterations', 2000)
+    if ctx['backend'] == 'sqlite':
+        bench.withConnection(ctx, lambda conn: populateSqlite(conn, rows))
+        transaction = transactionSqlite
+    else:
+        bench.withConnection(ctx, lambda conn: populatePgsql(conn, rows))
+        transaction = transactionPgsql
+
+    connectionPool = None
+    if mode == 'pooled':
+        setup = None
+        if ctx['backend'] == 'sqlite' and ctx.get('pragmas'):
+            setup = lambda conn: sqlitePragmas.apply(conn, ctx['pragmas'])
+        connectionPool = pool.Pool(
+            lambda: bench.connect(dict(ctx, pragmas = None)),
+            bench.param(ctx, 'pool_size', 4), bench.param(ctx, 'pool_idle', 60), setup
+        )
+    elif mode not in ('held', 'per-request'):
+        raise ValueError('Unknown connection mode: %s' % mode)
+
+    hist = latency.Histogram()
+    lock = threading.Lock()
+
+    def client(index):
+        rnd = random.Random(index)
+        held = bench.connect(ctx) if mode == 'held' else None
+        if mode == 'held':
+            borrow = lambda f: f(held)
+        elif mode == 'pooled':
+            borrow = connectionPool.withConnection
+        else:
+            borrow = lambda f: withNewConnection(ctx, f)
+        try:
+            # Each client uses its own range of keys so that unique addresses do not collide.
+            for i in soak.repeat(n, index * n):
+                start = latency.now()
+                borrow(lambda conn: transaction(conn, rnd.randint(1, rows), i))
+                elapsed = latency.now() - start
+                # Into the histogram of the phase as they happen, so that samplers and the
+                # warm-up see them.
+                with lock:
+                    hist.record(elapsed)
+        finally:
+            if held:
+                held.close()
+
+    def perform():
+        threads = [threading.Thread(target = client, args = (i, )) for i in range(clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    title = "%s transactions with %s connections and %d clients" % (ctx['backend'], mode, clients)
+    try:
+        r = bench.withStopwatch(title, perform, hist)
+    finally:
+        if connectionPool:
+            connectionPool.close()
+    if r is not None and connectionPool:
+        r.update(connectionPool.summary())
+        print('%s pool: created=%d reused=%d evicted=%d wait p99=%.3fms max=%.3fms' % (
+            title, connectionPool.created, connectionPool.reused, connectionPool.evicted,
+            r['pool_wait_p99_ms'], r['pool_wait_max_ms']
+        ))
+
+bench.register(
+    'pool', sqlite = poolBench, pgsql = poolBench, perConnection = False,
+    params = ['connection', 'clients', 'pool_size', 'retry']
+)
+
+if __name__ == '__main__':
+    import runner
+    runner.main(['pool'] + sys.argv[1:])
@@ -0,0 +1,63 @@
+"""SQLite PRAGMA profiles.
+
+A profile is a dict of pragma name to value applied on every SQLite connection opened by
+bench.withConnection. Profiles are either taken by name from PROFILES or built as the
+cartesian product of pragma values given on the command line, e.g.
+--pragma=synchronous=OFF,NORMAL,FULL --pragma=cache_size=-2000,-65536 yields six profiles.
+"""
+
+import itertools
+
+PROFILES = {
+    # SQLite defaults.
+    'default': {},
+    'wal': {'journal_mode': 'WAL', 'synchronous': 'FULL'},
+    'wal-normal': {'journal_mode': 'WAL', 'synchronous': 'NORMAL'},
+    'durable': {'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+    'fast': {
+        'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': -65536, 'temp_store': 'MEMORY',
+        'mmap_size': 268435456,
+    },
+    'unsafe': {'journal_mode': 'MEMORY', 'synchronous': 'OFF', 'temp_store': 'MEMORY'},
+    # Only one connection can use the database. Not usable with the concurrent workloads.
+    'exclusive': {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'locking_mode': 'EXCLUSIVE'},
+    'big-page': {'page_size': 16384, 'journal_mode': 'WAL', 'synchronous': 'NORMAL'},
+    'no-autocheckpoint': {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'wal_autocheckpoint': 0},
+}
+
+# page_size has to be set before the journal mode is switched to WAL and before any table
+# is created. locking_mode must be set before the first read.
+ORDER = ['page_size', 'locking_mode', 'journal_mode']
+
+def ordered(pragmas):
+    return sorted(pragmas.items(), key = lambda kv: (ORDER.index(kv[0]) if kv[0] in ORDER else len(ORDER), kv[0]))
+
+def apply(conn, pragmas):
+    for name, value in ordered(pragmas):
+        conn.execute("PRAGMA %s=%s" % (name, value)).fetchall()
+
+def describe(pragmas):
+    return ';'.join('%s=%s' % kv for kv in ordered(pragmas))
+
+def parseGrid(specs):
+    # ['synchronous=OFF,NORMAL', 'cache_size=-2000'] -> list of profiles.
+    axes = []
+    for spec in specs:
+        name, values = spec.split('=', 1)
+        axes.append([(name.strip(), v.strip()) for v in values.split(',')])
+    return [dict(combo) for combo in itertools.product(*axes)]
+
+def points(profileNames, specs):
+    """Return the list of (profile name, pragmas) to run."""
+    profiles = []
+    for name in (profileNames.split(',') if profileNames else []):
+        if name not in PROFILES:
+            raise ValueError('Unknown pragma profile: %s (known: %s)' % (name, ', '.join(PROFILES)))
+        profiles.append((name, PROFILES[name]))
+    if not profiles:
+        profiles = [(None, {})]
+    grid = parseGrid(specs) if specs else [{}]
+    return [
+        (name if not g else (name + '+' if name else '') + describe(g), dict(p, **g))
+        for (name, p), g in itertools.product(profiles, grid)
+    ]
@@ -0,0 +1,163 @@
+"""Perform point lookup and range scan benchmark test.
+
+Registers the 'read' workload. Running this script is the same as 'runner.py read'.
+Reads the datagen data (see --scale, restored from a fixture) 10000 times per query (see
+--iterations) with keys drawn from --distribution:
+    uniform     Every key is equally likely.
+    zipf        A few hot keys get most lookups (exponent --zipf), spread over the key space.
+    sequential  Keys in ascending order, as a batch job walking the table would.
+    latest      Mostly the most recently created keys.
+Queries are primary key lookups and unique key lookups of users, range scans of departments
+by created (expecting 10 rows each) and the same range scans answered from the
+department_created index alone (covering). Every query runs with its index and with the
+planner kept from using it, which on SQLite is done by the unary + on the column and on
+Postgres by disabling index scans. Finally departments are inserted with and without the
+department_created index to show what the index costs on writes.
+"""
+
+import sys, time, math, random, bench, latency, soak, datagen, cacheState
+
+DISTRIBUTIONS = ('uniform', 'zipf', 'sequential', 'latest')
+RANGE_ROWS = 10
+
+QUERIES = [
+    ('users by primary key', 'users', "select * from users where {plus}user_id = {p}"),
+    ('users by user_name', 'users', "select * from users where {plus}user_name = {p}"),
+    (
+        'departments by created range', 'departments',
+        "select department_id, department_name, created from departments " +
+        "where {plus}created >= {p} and {plus}created < {p}"
+    ),
+    (
+        'departments by created range covering', 'departments',
+        "select count(*) from departments where {plus}created >= {p} and {plus}created < {p}"
+    ),
+]
+
+def keys(distribution, n, count, exponent, seed = 0):
+    """Return n keys in 1..count."""
+    rnd = random.Random(seed)
+    if distribution == 'uniform':
+        return [rnd.randint(1, count) for i in range(n)]
+    if distribution == 'sequential':
+        return [i % count + 1 for i in range(n)]
+    if distribution == 'latest':
+        # Exponentially fewer lookups the older the key is, 1/10 of the keys get most of them.
+        return [max(1, count - int(rnd.expovariate(10.0 / count))) for i in range(n)]
+    if distribution == 'zipf':
+        # Inverse transform of a continuous power law gives the rank, a multiplicative hash
+        # spreads the ranks over the key space so hot keys do not sit next to each other.
+        return [(zipfRank(rnd.random(), count, exponent) * 2654435761) % count + 1 for i in range(n)]
+    raise ValueError('Unknown distribution: %s (known: %s)' % (distribution, ', '.join(DISTRIBUTIONS)))
+
+def zipfRank(u, count, exponent):
+    # Rank in 0..count-1 for u uniform in [0, 1).
+    if exponent == 1:
+        return min(count - 1, int(math.exp(u * math.log(count + 1))) - 1)
+    a = 1 - exponent
+    return min(count - 1, int((((count + 1) ** a - 1) * u + 1) ** (1 / a)) - 1)
+
+def createdRange(key, count):
+    # datagen spreads created over TIME_SPAN, so a key maps to a time and RANGE_ROWS rows
+    # are expected within the following width.
+    start = datagen.BASE_TIME + datagen.TIME_SPAN * (key - 1) // count
+    width = datagen.TIME_SPAN * RANGE_ROWS // count
+    return tuple(
+        time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(t)) for t in (start, start + width)
+    )
+
+def argsFor(name, key, count):
+    if name == 'users by primary key':
+        return (key, )
+    if name == 'users by user_name':
+        return ('user%08d' % key, )
+    return createdRange(key, count)
+
+def indexHintPgsql(conn, indexed):
+    # SQLite needs no setting, the unary + on the column keeps its planner from using an index.
+    cur = conn.cursor()
+    for setting in ['enable_indexscan', 'enable_bitmapscan', 'enable_indexonlyscan']:
+        cur.execute("set %s = %s" % (setting, 'on' if indexed else 'off'))
+    conn.commit()
+
+def performQueries(conn, sql, keyList, name, count, hist, endRead):
+    cur = conn.cursor()
+    for i in soak.repeat(len(keyList)):
+        key = keyList[i % len(keyList)]
+        start = latency.now()
+        cur.execute(sql, argsFor(name, key, count))
+        cur.fetchall()
+        endRead(conn)
+        hist.record(latency.now() - start)
+
+def insertDepartments(conn, ctx, beginTranFunc, commitTranFunc, placeholder, hist):
+    rows = bench.param(ctx, 'rows', 10000)
+
+    # Named apart from the datagen departments, created within the same year.
+    def insertFunc(cur, chunk):
+        cur.executemany(
+            "insert into departments (department_name, created) values (%s, %s)" % (placeholder, placeholder),
+            map((lambda i: ("newdept%08d" % i, createdRange(i, rows)[0])), chunk)
+        )
+
+    return bench.bulkUpdate(
+        conn, beginTranFunc, commitTranFunc, insertFunc, hist, rows, ctx['batch'], bench.param(ctx, 'txn', ctx['batch'])
+    )
+
+def readBench(conn, ctx, backend):
+    s = datagen.spec(ctx)
+    n = bench.param(ctx, 'iterations', 10000)
+    distribution = bench.param(ctx, 'distribution', 'uniform')
+    placeholder = backend['placeholder']
+    for name, table, template in QUERIES:
+        count = s[table]
+        keyList = keys(distribution, n, count, s['zipf'])
+        for indexed in [True, False]:
+            sql = template.format(plus = '' if indexed else backend['noIndex'], p = placeholder)
+            # The hint is set on the connection of the phase, which may be a fresh one.
+            def perform(conn, hist):
+                backend['indexHint'](conn, indexed)
+                performQueries(conn, sql, keyList, name, count, hist, backend['endRead'])
+
+            cacheState.withLatency(
+                "%s (%s) with %s index %s" % (name, distribution, backend['name'], 'on' if indexed else 'off'),
+                conn, ctx, perform
+            )
+        backend['indexHint'](conn, True)
+
+    for indexed in [True, False]:
+        if not indexed:
+            conn.cursor().execute("drop index department_created")
+            backend['commit']()
+        bench.withLatency(
+            "insert departments with %s department_created index %s" % (backend['name'], 'on' if indexed else 'off'),
+            lambda hist: insertDepartments(
+                conn, ctx, backend['beginTranFunc'], backend['commitTranFunc'], placeholder, hist
+            )
+        )
+        conn.cursor().execute("delete from departments where department_name like 'newdept%'")
+        backend['commit']()
+
+def readBenchSqlite(conn, ctx):
+    readBench(conn, ctx, {
+        'name': 'SQLite', 'placeholder': '?', 'noIndex': '+', 'indexHint': (lambda conn, indexed: None),
+        'endRead': (lambda conn: None), 'commit': (lambda: None),
+        'beginTranFunc': lambda cur: cur.execute('BEGIN TRANSACTION'),
+        'commitTranFunc': lambda cur: cur.execute('COMMIT'),
+    })
+
+def readBenchPgsql(conn, ctx):
+    readBench(conn, ctx, {
+        'name': 'Postgres', 'placeholder': '%s', 'noIndex': '', 'indexHint': indexHintPgsql,
+        'endRead': (lambda conn: conn.rollback()), 'commit': conn.commit,
+        'beginTranFunc': (lambda cur: None), 'commitTranFunc': lambda cur: conn.commit(),
+    })
+
+bench.register(
+    'read', sqlite = readBenchSqlite, pgsql = readBenchPgsql, fixture = True,
+    params = ['batch', 'txn', 'distribution', 'cache', 'scale']
+)
+
+if __name__ == '__main__':
+    import runner
+    runner.main(['read'] + sys.argv[1:])
@@ -0,0 +1,146 @@
+"""An in-process read-through result cache (runner --result-cache).
+
+Results are kept by SQL text and parameters, at most 'capacity' of them (runner --cache-size)
+with the least recently used dropped first, each for 'ttl' seconds (runner --cache-ttl) after
+it was read from the database. Writers report the tables they changed with written() once
+their transaction committed, and the policy decides what that does:
+    off         No cache, every read goes to the database.
+    invalidate  Entries read from those tables are dropped. The cache serves stale rows only
+                between the commit and written(), the staleness window reported by
+                summary(). A read racing a write could store rows read before the write
+                after written() dropped the entries, so every table has a generation bumped by
+                written() and rows of reads that saw it change are returned but not stored.
+    ttl         Entries stay until they expire. Hits on entries read before a later write to
+                one of their tables are counted as stale hits, with the time since that write.
+Invalidation is by table, so a write to one user drops every cached read of users.
+"""
+
+import collections, threading, time
+import bench, latency
+
+POLICIES = ('off', 'invalidate', 'ttl')
+
+class ResultCache:
+    def __init__(self, capacity, ttl, policy = 'invalidate'):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.policy = policy
+        # (sql, params) -> (rows, tables, time read)
+        self.entries = collections.OrderedDict()
+        self.byTable = collections.defaultdict(set)
+        self.generations = collections.defaultdict(int)
+        self.lastWrite = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        self.invalidated = 0
+        self.races = 0
+        self.staleHits = 0
+        # Time since the write that made a stale hit stale, and from commit to invalidation.
+        self.staleness = latency.Histogram()
+        self.window = latency.Histogram()
+
+    def fetch(self, sql, params, tables, query):
+        """Return the rows of sql with params, running query() to read them on a miss."""
+        key = (sql, params)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                rows, entryTables, stored = entry
+                if now - stored <= self.ttl:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    written = max((self.lastWrite.get(t, 0) for t in entryTables), default = 0)
+                    if written > stored:
+                        self.staleHits += 1
+                        self.staleness.record(int((now - written) * 1e9))
+                    return rows
+                self.expired += 1
+                self.drop(key)
+            self.misses += 1
+            generations = [self.generations[t] for t in tables]
+        rows = query()
+        with self.lock:
+            if [self.generations[t] for t in tables] != generations:
+                self.races += 1
+            else:
+                self.store(key, rows, tables, now)
+        return rows
+
+    def store(self, key, rows, tables, now):
+        # Called with the lock held.
+        if key in self.entries:
+            self.drop(key)
+        self.entries[key] = (rows, tables, now)
+        for t in tables:
+            self.byTable[t].add(key)
+        while len(self.entries) > self.capacity:
+            self.drop(next(iter(self.entries)))
+            self.evicted += 1
+
+    def drop(self, key):
+        rows, tables, stored = self.entries.pop(key)
+        for t in tables:
+            self.byTable[t].discard(key)
+
+    def written(self, tables, committed):
+        """Report a write to tables committed at time.monotonic() 'committed'."""
+        with self.lock:
+            for t in tables:
+                self.lastWrite[t] = committed
+                if self.policy == 'invalidate':
+                    self.generations[t] += 1
+                    for key in list(self.byTable[t]):
+                        self.drop(key)
+                        self.invalidated += 1
+            if self.policy == 'invalidate':
+                self.window.record(int((time.monotonic() - committed) * 1e9))
+
+    def summary(self):
+        reads = self.hits + self.misses
+        s = {
+            'cache_hits': self.hits, 'cache_misses': self.misses,
+            'cache_hit_rate': self.hits / reads if reads else 0,
+            'cache_expired': self.expired, 'cache_evicted': self.evicted,
+            'cache_invalidated': self.invalidated, 'cache_races': self.races, 'cache_stale_hits': self.staleHits,
+        }
+        if self.staleness.count:
+            s['cache_stale_max_ms'] = self.staleness.max / 1e6
+        if self.window.count:
+            s['cache_window_p99_ms'] = self.window.percentile(99) / 1e6
+            s['cache_window_max_ms'] = self.window.max / 1e6
+        return s
+
+def create(ctx):
+    """Return the result cache of the policy of ctx, None for off."""
+    policy = bench.param(ctx, 'result_cache', 'off')
+    if policy not in POLICIES:
+        raise ValueError('Unknown result cache policy: %s (known: %s)' % (policy, ', '.join(POLICIES)))
+    if policy == 'off':
+        return None
+    return ResultCache(bench.param(ctx, 'cache_size', 1000), bench.param(ctx, 'cache_ttl', 60.0), policy)
+
+def read(cache, cur, sql, params, tables):
+    """cur.execute(sql, params) and return fetchall(), through cache unless it is None."""
+    def query():
+        cur.execute(sql, params)
+        return cur.fetchall()
+    return query() if cache is None else cache.fetch(sql, params, tables, query)
+
+def report(title, cache, r):
+    """Add the statistics of cache to the record r of a phase, if both are there."""
+    if cache is None or r is None:
+        return
+    r.update(cache.summary())
+    line = '%s result cache: hit rate=%.1f%% hits=%d misses=%d evicted=%d invalidated=%d races=%d stale hits=%d' % (
+        title, 100 * r['cache_hit_rate'], r['cache_hits'], r['cache_misses'], r['cache_evicted'],
+        r['cache_invalidated'], r['cache_races'], r['cache_stale_hits']
+    )
+    if 'cache_stale_max_ms' in r:
+        line += ' stale max=%.3fms' % r['cache_stale_max_ms']
+    if 'cache_window_max_ms' in r:
+        line += ' window p99=%.3fms max=%.3fms' % (r['cache_window_p99_ms'], r['cache_window_max_ms'])
+    print(line)
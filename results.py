@@ -0,0 +1,261 @@
+"""Write benchmark results as JSON/CSV records and compare two result files.
+
+usage: results.py compare [--threshold=<pct>] <base> <new>
+       results.py plans <file>...
+       results.py split <file>...
+       results.py gain <file>...
+       results.py show <file>
+
+options:
+    -h, --help         Show this help message and exit
+    --threshold=<pct>  Allowed slowdown in percent before a phase is flagged [default: 5].
+
+Every phase measured by bench.withStopwatch becomes one record. The runner stores the run
+metadata (workload, backend, journal mode, row count, batch size...) in 'context' before
+each run and writes the collected records with write() when --output is given.
+
+compare flags phases slower than the threshold and phases whose query plan ('plan' recorded
+by the joins workload) changed. plans lists phases run with different versions or pragma
+settings (in one or more files) that did not get the same plan. split divides the elapsed
+time of phases run on files into engine cost, that of the same phase on an in-memory
+database (see storage.py), and durability cost, the rest. gain compares the throughput of
+phases run through a result cache (see resultCache.py) with the same phases run without.
+"""
+
+from docopt import docopt
+import sys, os, re, csv, json, time, sqlite3, platform, statistics
+
+# Metadata of the run in progress, copied into every record.
+context = {}
+records = []
+
+def record(title, elapsed, hist = None):
+    r = dict(context, phase = title, elapsed = elapsed)
+    if hist is not None and hist.count:
+        r.update(hist.summary(elapsed))
+    records.append(r)
+    return r
+
+def cpuModel():
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor()
+
+def environment(pgsqlVersion = None):
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'sqlite_version': sqlite3.sqlite_version,
+        'pgsql_version': pgsqlVersion,
+        'python_version': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu': cpuModel(),
+        'cpu_count': os.cpu_count(),
+    }
+
+def write(path, env):
+    if path.endswith('.csv'):
+        rows = [dict(env, **r) for r in records]
+        fields = []
+        for r in rows:
+            for k in r:
+                if k not in fields:
+                    fields.append(k)
+        with open(path, 'w', newline = '') as f:
+            w = csv.DictWriter(f, fieldnames = fields)
+            w.writeheader()
+            w.writerows(rows)
+    else:
+        with open(path, 'w') as f:
+            json.dump({'environment': env, 'results': records}, f, indent = 2)
+
+def load(path):
+    if path.endswith('.csv'):
+        with open(path, newline = '') as f:
+            rows = list(csv.DictReader(f))
+        for r in rows:
+            for k, v in r.items():
+                try:
+                    r[k] = float(v) if v != '' else None
+                    if r[k] is not None and r[k].is_integer():
+                        r[k] = int(r[k])
+                except ValueError:
+                    pass
+        return rows
+    with open(path) as f:
+        doc = json.load(f)
+    return [dict(doc['environment'], **r) for r in doc['results']]
+
+# Fields that differ between runs of the same configuration.
+MEASURED = {
+    'run', 'elapsed', 'count', 'mean_ms', 'p50_ms', 'p90_ms', 'p99_ms', 'p999_ms', 'max_ms', 'ops_per_sec',
+    'rows_per_sec', 'busy', 'lock_timeouts', 'lock_wait_total_ms', 'lock_wait_p99_ms', 'lock_wait_max_ms',
+    'pool_created', 'pool_reused', 'pool_evicted', 'pool_wait_p99_ms', 'pool_wait_max_ms',
+    'service_p50_ms', 'service_p99_ms', 'late_ops', 'prepare_ms', 'first_row_ms', 'plan', 'shared_hit', 'shared_read',
+    'wal_max_mb', 'wal_final_mb', 'checkpoints', 'checkpoint_busy', 'wal_timeline', 'checkpoint_p99_ms',
+    'checkpoint_max_ms', 'peak_rss_mb', 'rss_growth_mb', 'py_peak_mb', 'top_allocators', 'sqlite_memory_used_mb',
+    'sqlite_memory_highwater_mb', 'sqlite_pagecache_overflow_mb', 'pgsql_backend_rss_mb', 'pgsql_backend_peak_mb',
+    'io_read_bytes', 'io_write_bytes', 'io_wchar', 'io_syscw', 'pgsql_read_bytes', 'pgsql_write_bytes',
+    'file_growth_bytes', 'device_write_bytes', 'device_flushes', 'logical_bytes', 'write_amplification',
+    'first_query_ms', 'eviction', 'mmap_mb', 'db_mb', 'ram_mb', 'minor_faults', 'major_faults',
+    'cache_hits', 'cache_misses', 'cache_hit_rate', 'cache_expired', 'cache_evicted', 'cache_invalidated',
+    'cache_races', 'cache_stale_hits', 'cache_stale_max_ms', 'cache_window_p99_ms', 'cache_window_max_ms',
+    'timestamp', 'sqlite_version', 'pgsql_version', 'python_version', 'platform', 'cpu', 'cpu_count',
+}
+
+def configKey(r):
+    return tuple(sorted((k, str(v)) for k, v in r.items() if k not in MEASURED))
+
+def group(rows):
+    groups = {}
+    for r in rows:
+        groups.setdefault(configKey(r), []).append(r)
+    return groups
+
+def median(rows, field):
+    values = [r[field] for r in rows if r.get(field) is not None]
+    return statistics.median(values) if values else None
+
+def change(base, new):
+    if not base or new is None:
+        return None
+    return (new - base) / base * 100
+
+def label(key):
+    return ' '.join('%s=%s' % (k, v) for k, v in key if v != 'None')
+
+def plans(rows):
+    return sorted({str(r['plan']) for r in rows if r.get('plan')})
+
+def compare(basePath, newPath, threshold):
+    base = group(load(basePath))
+    new = group(load(newPath))
+    regressions = 0
+    planChanges = 0
+    for key, rows in new.items():
+        if key not in base:
+            continue
+        before, after = plans(base[key]), plans(rows)
+        if before and after and before != after:
+            planChanges += 1
+            print('PLAN CHANGED %s: %s -> %s' % (label(key), ' | '.join(before), ' | '.join(after)))
+        checks = [('ops_per_sec', True), ('p99_ms', False)] if median(rows, 'ops_per_sec') else [('elapsed', False)]
+        checks += [('peak_rss_mb', False)]
+        for field, higherIsBetter in checks:
+            b = median(base[key], field)
+            n = median(rows, field)
+            ratio = change(b, n)
+            if ratio is None:
+                continue
+            slower = -ratio if higherIsBetter else ratio
+            status = 'REGRESSION' if slower > threshold else ('improved' if slower < -threshold else 'ok')
+            if status == 'REGRESSION':
+                regressions += 1
+            print('%-10s %s %s: %.3f -> %.3f (%+.1f%%)' % (status, label(key), field, b, n, ratio))
+    print('%d regression(s) beyond %.1f%%, %d plan change(s)' % (regressions, threshold, planChanges))
+    return regressions + planChanges
+
+# Settings a plan is expected not to depend on, compared by planFlips().
+PLAN_SETTINGS = {'pragma_profile', 'pragmas', 'journal_mode', 'sqlite_version', 'pgsql_version'}
+
+def planFlips(paths):
+    rows = [r for path in paths for r in load(path) if r.get('plan')]
+    groups = {}
+    for r in rows:
+        key = tuple(sorted((k, str(v)) for k, v in r.items() if k not in MEASURED and k not in PLAN_SETTINGS))
+        groups.setdefault(key, []).append(r)
+    flips = 0
+    for key, members in groups.items():
+        byPlan = {}
+        for r in members:
+            setting = ' '.join('%s=%s' % (k, r.get(k)) for k in sorted(PLAN_SETTINGS) if r.get(k) is not None)
+            byPlan.setdefault(str(r['plan']), set()).add(setting)
+        if len(byPlan) > 1:
+            flips += 1
+            print('PLAN DIFFERS %s' % label(key))
+            for plan, settings in byPlan.items():
+                print('    %s\n        with %s' % (plan, '; '.join(sorted(settings))))
+    print('%d phase(s) with differing plans' % flips)
+    return flips
+
+def synchronous(r):
+    m = re.search('(?:^|;)synchronous=([^;]*)', str(r.get('pragmas') or ''))
+    return m.group(1) if m else 'default'
+
+def splitKey(r):
+    # Same work on any storage and synchronous level.
+    pragmas = re.sub('(?:^|;)synchronous=[^;]*', '', str(r.get('pragmas') or ''))
+    return tuple(sorted(
+        [(k, str(v)) for k, v in r.items() if k not in MEASURED and k not in ('storage', 'pragma_profile', 'pragmas')] +
+        [('pragmas', pragmas)]
+    ))
+
+def split(rows):
+    engine = {}
+    for r in rows:
+        if r.get('storage') in ('memory', 'shared-memory'):
+            engine.setdefault(splitKey(r), []).append(r['elapsed'])
+    count = 0
+    for r in rows:
+        key = splitKey(r)
+        if r.get('storage') in (None, 'memory', 'shared-memory') or key not in engine:
+            continue
+        base = statistics.median(engine[key])
+        durability = r['elapsed'] - base
+        count += 1
+        print('%-6s synchronous=%-7s %9.3fs engine=%9.3fs durability=%9.3fs (%5.1f%%)  %s' % (
+            r['storage'], synchronous(r), r['elapsed'], base, durability,
+            100.0 * durability / r['elapsed'] if r['elapsed'] else 0, r['phase']
+        ))
+    return count
+
+def throughput(r):
+    return r.get('rows_per_sec', r.get('ops_per_sec'))
+
+def gainKey(r):
+    # Same work with or without a result cache of any size.
+    return tuple(sorted(
+        (k, str(v)) for k, v in r.items() if k not in MEASURED and k not in ('result_cache', 'cache_size', 'cache_ttl')
+    ))
+
+def gain(rows):
+    uncached = {}
+    for r in rows:
+        if r.get('result_cache') == 'off' and throughput(r):
+            uncached.setdefault(gainKey(r), []).append(throughput(r))
+    count = 0
+    for r in rows:
+        key = gainKey(r)
+        # Phases of a cached run not reading through the cache are left out.
+        if 'cache_hits' not in r or key not in uncached or not throughput(r):
+            continue
+        base = statistics.median(uncached[key])
+        count += 1
+        print('%-10s %10.1f/sec uncached=%10.1f/sec gain=%6.2fx hit rate=%5.1f%% stale hits=%d  %s' % (
+            r['result_cache'], throughput(r), base, throughput(r) / base, 100 * r.get('cache_hit_rate', 0),
+            r.get('cache_stale_hits', 0), r['phase']
+        ))
+    return count
+
+def show(path):
+    for r in load(path):
+        print(' '.join('%s=%s' % (k, v) for k, v in r.items() if v is not None))
+
+if __name__ == '__main__':
+    args = docopt(__doc__)
+    if args['compare']:
+        sys.exit(1 if compare(args['<base>'], args['<new>'], float(args['--threshold'])) else 0)
+    elif args['plans']:
+        sys.exit(1 if planFlips(args['<file>']) else 0)
+    elif args['gain']:
+        if not gain([r for path in args['<file>'] for r in load(path)]):
+            print('No phase run both with and without a result cache.')
+    elif args['split']:
+        if not split([r for path in args['<file>'] for r in load(path)]):
+            print('No phase run both on a file and in memory.')
+    else:
+        show(args['<file>'][0])
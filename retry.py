@@ -0,0 +1,158 @@
+"""SQLITE_BUSY handling policies and lock-wait instrumentation for SQLite transactions.
+
+Policies:
+    builtin  sqlite3's own busy handler waits up to 'timeout' seconds inside SQLite. The waits
+             are invisible from Python, so only the lock timeouts that escape are counted.
+    backoff  The connection is opened with timeout 0 and every SQLITE_BUSY is retried by the
+             application with exponential backoff and full jitter. Every busy and the time spent
+             sleeping are recorded.
+
+Shared cache connections (see storage.py) fail with SQLITE_LOCKED on table locks, which the
+busy handler of SQLite does not wait for, so it is retried with backoff under both policies.
+
+The transaction is started with BEGIN (deferred) or BEGIN IMMEDIATE depending on 'begin'.
+Statistics are kept per thread and summed per benchmark phase in 'phases'.
+"""
+
+import sqlite3, threading, time, random
+import latency
+
+policy = {'retry': 'builtin', 'begin': 'deferred', 'timeout': 60}
+BACKOFF_BASE = 0.001
+BACKOFF_CAP = 0.1
+
+local = threading.local()
+phases = {}
+phasesLock = threading.Lock()
+
+class LockStats:
+    def __init__(self):
+        self.busy = 0
+        self.timeouts = 0
+        self.waits = latency.Histogram()
+
+    def merge(self, other):
+        self.busy += other.busy
+        self.timeouts += other.timeouts
+        self.waits.merge(other.waits)
+        return self
+
+    def summary(self):
+        return {
+            'busy': self.busy,
+            'lock_timeouts': self.timeouts,
+            'lock_wait_total_ms': self.waits.total / 1e6,
+            'lock_wait_p99_ms': self.waits.percentile(99) / 1e6,
+            'lock_wait_max_ms': self.waits.max / 1e6,
+        }
+
+    def toDict(self):
+        return {'busy': self.busy, 'timeouts': self.timeouts, 'waits': self.waits.toDict()}
+
+    @classmethod
+    def fromDict(cls, d):
+        s = cls()
+        s.busy = d['busy']
+        s.timeouts = d['timeouts']
+        s.waits = latency.Histogram.fromDict(d['waits'])
+        return s
+
+def configure(retry, begin, timeout = 60):
+    policy.update(retry = retry, begin = begin, timeout = timeout)
+
+def connectTimeout():
+    return 0 if policy['retry'] == 'backoff' else policy['timeout']
+
+def threadStats():
+    if not hasattr(local, 'stats'):
+        local.stats = LockStats()
+    return local.stats
+
+def resetThreadStats():
+    local.stats = LockStats()
+    return local.stats
+
+def addPhase(title, stats):
+    with phasesLock:
+        phases.setdefault(title, LockStats()).merge(stats)
+
+def describe(title, stats):
+    s = stats.summary()
+    return '%s lock: busy=%d timeouts=%d wait total=%.3fms p99=%.3fms max=%.3fms' % (
+        title, s['busy'], s['lock_timeouts'], s['lock_wait_total_ms'], s['lock_wait_p99_ms'], s['lock_wait_max_ms']
+    )
+
+def isBusy(e):
+    msg = str(e)
+    return 'locked' in msg or 'busy' in msg
+
+def retried(e):
+    return policy['retry'] == 'backoff' or 'table is locked' in str(e)
+
+def rollback(conn):
+    if conn.in_transaction:
+        conn.execute('ROLLBACK')
+
+def transaction(conn, func, begin = None, committed = None):
+    """Run func(cur) in a transaction, handling SQLITE_BUSY according to the policy.
+
+    'begin' overrides the policy's transaction start for this transaction. 'committed' is
+    called as soon as the COMMIT succeeded.
+    """
+    stats = threadStats()
+    begin = 'BEGIN IMMEDIATE TRANSACTION' if (begin or policy['begin']) == 'immediate' else 'BEGIN TRANSACTION'
+    deadline = time.monotonic() + policy['timeout']
+    attempt = 0
+    committing = False
+    ret = None
+    cur = conn.cursor()
+    while True:
+        try:
+            if not committing:
+                cur.execute(begin)
+                ret = func(cur)
+                committing = True
+            cur.execute('COMMIT')
+            if committed:
+                committed()
+            return ret
+        except sqlite3.OperationalError as e:
+            if not isBusy(e):
+                raise
+            stats.busy += 1
+            if not retried(e) or time.monotonic() >= deadline:
+                stats.timeouts += 1
+                rollback(conn)
+                raise
+            if not committing:
+                # Statements may have read a snapshot that is stale now, so start over.
+                rollback(conn)
+            backoff(stats, attempt)
+            attempt += 1
+
+def retrying(func):
+    """Wrap func running statements in auto commit mode to retry them on SQLITE_BUSY."""
+    def wrapper(*args):
+        stats = threadStats()
+        deadline = time.monotonic() + policy['timeout']
+        attempt = 0
+        while True:
+            try:
+                return func(*args)
+            except sqlite3.OperationalError as e:
+                if not isBusy(e):
+                    raise
+                stats.busy += 1
+                if not retried(e) or time.monotonic() >= deadline:
+                    stats.timeouts += 1
+                    raise
+                backoff(stats, attempt)
+                attempt += 1
+    return wrapper
+
+def backoff(stats, attempt):
+    # Exponential backoff with full jitter.
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+    start = latency.now()
+    time.sleep(delay)
+    stats.waits.record(latency.now() - start)
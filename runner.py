@@ -0,0 +1,383 @@
+"""Run benchmark workloads.
+
+usage: runner.py [-h] [--list] [--backend=<names>] [--db=<path>] [--wal] [--copy]
+                 [--rows=<n>] [--iterations=<n>] [--batch=<list>] [--txn=<list>] [--repeat=<n>] [--warmup=<n>]
+                 [--profile=<names>] [--pragma=<spec>...] [--writers=<list>] [--readers=<list>]
+                 [--retry=<list>] [--begin=<list>] [--connection=<list>] [--clients=<list>]
+                 [--pool-size=<list>] [--pool-idle=<secs>] [--rate=<list>] [--arrival=<list>]
+                 [--scale=<list>] [--seed=<n>] [--addresses=<n>] [--departments=<n>] [--zipf=<s>]
+                 [--fixtures=<dir>]
+                 [--distribution=<list>] [--values-rows=<list>] [--read-ratio=<list>] [--checkpoint=<list>]
+                 [--memory] [--tracemalloc] [--interval=<secs>] [--series=<file>]
+                 [--duration=<secs>] [--warmup-duration=<secs>] [--storage=<list>] [--tmpfs=<dir>]
+                 [--io] [--pgdata=<dir>] [--cache=<list>] [--result-cache=<list>] [--cache-size=<n>]
+                 [--cache-ttl=<secs>]
+                 [--output=<file>] [<workload>...]
+
+options:
+    -h, --help         Show this help message and exit
+    --list             List registered workloads and exit.
+    --backend=<names>  Comma separated list of backends to run against [default: sqlite,pgsql].
+    --db=<path>        SQLite database file [default: /tmp/test.db].
+    --wal              Use WAL(Write a head log) instead of traditional rollback journal for SQLite.
+    --copy             USE COPY statement instead of insert statement for Postgres.
+    --rows=<n>         Number of records to insert/update. Each workload has its own default.
+    --iterations=<n>   Number of times to repeat each query. Each workload has its own default.
+    --batch=<list>     Number of records passed at once to executemany in bulk insert/update [default: 100].
+    --txn=<list>       Number of records per transaction in bulk insert/update. Same as --batch if omitted.
+    --repeat=<n>       Number of measured runs of each workload [default: 1].
+    --warmup=<n>       Number of unreported runs before the measured ones [default: 0].
+    --profile=<names>  Comma separated list of SQLite pragma profiles to run under (see pragmas.py).
+    --pragma=<spec>    SQLite pragma values as name=v1,v2,... Can be repeated. Every combination is run.
+    --writers=<list>   Number of writer processes of concurrent-process [default: 1].
+    --readers=<list>   Number of reader processes of concurrent-process [default: 1].
+    --retry=<list>     SQLITE_BUSY policy of concurrent workloads, builtin or backoff (see retry.py) [default: builtin].
+    --begin=<list>     Transaction start of concurrent SQLite workloads, deferred or immediate [default: deferred].
+    --connection=<list>  Connection handling of the pool workload, held, pooled or per-request [default: pooled].
+    --clients=<list>   Number of client threads of the pool and open-loop workloads [default: 4].
+    --pool-size=<list>  Maximum number of pooled connections [default: 4].
+    --pool-idle=<secs>  Close pooled connections idle for longer than this [default: 60].
+    --rate=<list>      Target operations/sec of the open-loop workload [default: 1000].
+    --arrival=<list>   Arrivals of the open-loop workload, constant or poisson [default: constant].
+    --scale=<list>     Data size of datagen in units of 10000 users, may be fractional [default: 1].
+    --seed=<n>         Random seed of datagen [default: 0].
+    --addresses=<n>    Number of distinct addresses of datagen. 1 per 100 users if omitted.
+    --departments=<n>  Number of departments of datagen, whatever the scale [default: 1000].
+    --zipf=<s>         Exponent of the Zipf distribution of department membership in datagen [default: 1.1].
+    --fixtures=<dir>   Directory of the SQLite fixtures of the workloads reading datagen data [default: /tmp/bench-fixtures].
+    --distribution=<list>  Key distribution of the read workload, uniform, zipf, sequential or latest [default: uniform].
+    --values-rows=<list>  Rows per multi-row INSERT statement of the bulk-load workload [default: 100].
+    --read-ratio=<list>  Percentage of reads of the mixed workload [default: 95].
+    --checkpoint=<list>  WAL checkpoints of the mixed workload, auto, manual, passive, full or truncate [default: auto].
+    --memory           Report peak RSS and SQLite/Postgres backend memory of every phase (see memory.py).
+    --tracemalloc      Also trace Python allocations of every phase and report the top allocators. Slow.
+    --interval=<secs>  Sample throughput and latency of every phase at this interval (see timeseries.py).
+    --series=<file>    Write the samples and events of --interval to <file> (.json or .csv).
+    --duration=<secs>  Run the operations of every phase for this long instead of a number of times (see soak.py).
+    --warmup-duration=<secs>  Unmeasured time at the start of every phase with --duration [default: 0].
+    --storage=<list>   Where the SQLite database lives, disk, tmpfs, memory or shared-memory (see storage.py) [default: disk].
+    --tmpfs=<dir>      RAM backed directory of the tmpfs storage [default: /dev/shm].
+    --io               Report bytes read and written, write amplification and device flushes of every phase (see ioStats.py).
+    --pgdata=<dir>     Postgres data directory, whose server processes and size --io accounts [default: /tmp/pgsql-bench].
+    --cache=<list>     Cache state of the read phases, warm, sqlite-cold or os-cold (see cacheState.py) [default: warm].
+    --result-cache=<list>  Result cache in front of repeated reads, off, invalidate or ttl (see resultCache.py) [default: off].
+    --cache-size=<n>   Maximum number of results kept by --result-cache [default: 1000].
+    --cache-ttl=<secs>  Seconds a result is kept by --result-cache [default: 60].
+    --output=<file>    Write every phase result with run metadata to <file> (.json or .csv).
+
+Workloads run in the order given, all registered workloads if none is given.
+Batch/transaction sizes and writer/reader counts take comma separated lists. Every combination
+of them and of the pragma profiles is run and the throughput of each point is summarized at the end.
+Each workload is only run for the combinations of the settings it uses.
+"""
+
+from docopt import docopt
+import sys, itertools, bench, results, pragmas, retry, fixtures, memory, ioStats, timeseries, soak, storage, cacheState, resultCache
+import insertBench, updateBench, selectBench, selectBench2, selectBench3, selectBench4, concurrentBench
+import poolBench, openLoopBench, openLoop, statementBench, datagen, readBench, joinBench, bulkLoadBench
+import fetchBench, mixedBench, mmapBench
+
+def optionalInt(value):
+    return None if value is None else int(value)
+
+def intList(value):
+    return [int(v) for v in value.split(',')]
+
+def sweepPoints(args):
+    batches = intList(args['--batch'])
+    if args['--txn'] is None:
+        return [{'batch': b, 'txn': b} for b in batches]
+    return [{'batch': b, 'txn': t} for b, t in itertools.product(batches, intList(args['--txn']))]
+
+def processPoints(args):
+    return [
+        {'writers': w, 'readers': r}
+        for w, r in itertools.product(intList(args['--writers']), intList(args['--readers']))
+    ]
+
+def pragmaPoints(args):
+    return [
+        {'pragma_profile': name, 'pragmas': p}
+        for name, p in pragmas.points(args['--profile'], args['--pragma'])
+    ]
+
+def connectionPoints(args):
+    return [
+        {'connection': c, 'clients': n, 'pool_size': size}
+        for c, n, size in itertools.product(
+            args['--connection'].split(','), intList(args['--clients']), intList(args['--pool-size'])
+        )
+    ]
+
+def loadPoints(args):
+    points = [
+        {'rate': r, 'arrival': a}
+        for r, a in itertools.product(intList(args['--rate']), args['--arrival'].split(','))
+    ]
+    for p in points:
+        if p['arrival'] not in openLoop.ARRIVALS:
+            raise ValueError('Unknown arrival: %s' % p['arrival'])
+    return points
+
+def distributionPoints(args):
+    points = [
+        {'distribution': d, 'values_rows': n}
+        for d, n in itertools.product(args['--distribution'].split(','), intList(args['--values-rows']))
+    ]
+    for p in points:
+        if p['distribution'] not in readBench.DISTRIBUTIONS:
+            raise ValueError('Unknown distribution: %s' % p['distribution'])
+    return points
+
+def scalePoints(args):
+    return [{'scale': float(s)} for s in args['--scale'].split(',')]
+
+def mixPoints(args):
+    return [{'read_ratio': r} for r in intList(args['--read-ratio'])]
+
+def checkpointPoints(args):
+    points = [{'checkpoint': c} for c in args['--checkpoint'].split(',')]
+    for p in points:
+        if p['checkpoint'] not in mixedBench.CHECKPOINTS:
+            raise ValueError('Unknown checkpoint policy: %s' % p['checkpoint'])
+    return points
+
+def storagePoints(args):
+    points = [{'storage': s} for s in args['--storage'].split(',')]
+    for p in points:
+        if p['storage'] not in storage.STORAGES:
+            raise ValueError('Unknown storage: %s' % p['storage'])
+    return points
+
+def cachePoints(args):
+    points = [{'cache': c} for c in args['--cache'].split(',')]
+    for p in points:
+        if p['cache'] not in cacheState.STATES:
+            raise ValueError('Unknown cache state: %s' % p['cache'])
+    return points
+
+def resultCachePoints(args):
+    points = [{'result_cache': c} for c in args['--result-cache'].split(',')]
+    for p in points:
+        if p['result_cache'] not in resultCache.POLICIES:
+            raise ValueError('Unknown result cache policy: %s' % p['result_cache'])
+    return points
+
+def retryPoints(args):
+    points = [
+        {'retry': r, 'begin': b}
+        for r, b in itertools.product(args['--retry'].split(','), args['--begin'].split(','))
+    ]
+    for p in points:
+        if p['retry'] not in ('builtin', 'backoff') or p['begin'] not in ('deferred', 'immediate'):
+            raise ValueError('Unknown retry policy: %s/%s' % (p['retry'], p['begin']))
+    return points
+
+def project(points, keys):
+    # The points restricted to keys, each once.
+    projected = []
+    for p in points:
+        q = {k: v for k, v in p.items() if k in keys}
+        if q not in projected:
+            projected.append(q)
+    return projected
+
+def variants(args, backend, params):
+    # Every combination of the swept settings in params (see bench.register). Pragmas and storage apply to
+    # every SQLite workload, retry and checkpoint policies only to SQLite.
+    axes = [sweepPoints(args), processPoints(args), connectionPoints(args), loadPoints(args),
+        distributionPoints(args), mixPoints(args), cachePoints(args), scalePoints(args),
+        resultCachePoints(args)]
+    keys = set(params)
+    if backend == 'sqlite':
+        axes.append(pragmaPoints(args))
+        axes.append(retryPoints(args))
+        axes.append(checkpointPoints(args))
+        axes.append(storagePoints(args))
+        keys.update(['pragma_profile', 'pragmas', 'storage'])
+    variants = []
+    for combo in itertools.product(*[project(points, keys) for points in axes]):
+        v = {}
+        for d in combo:
+            v.update(d)
+        variants.append(v)
+    return variants
+
+def makeContext(args):
+    return {
+        'db': args['--db'],
+        'wal': args['--wal'],
+        'copy': args['--copy'],
+        'rows': optionalInt(args['--rows']),
+        'iterations': optionalInt(args['--iterations']),
+        'repeat': int(args['--repeat']),
+        'warmup': int(args['--warmup']),
+        'pool_idle': float(args['--pool-idle']),
+        'seed': int(args['--seed']),
+        'address_count': optionalInt(args['--addresses']),
+        'department_count': int(args['--departments']),
+        'zipf': float(args['--zipf']),
+        'fixtures': args['--fixtures'],
+        'tmpfs': args['--tmpfs'],
+        'pgdata': args['--pgdata'],
+        'cache_size': int(args['--cache-size']),
+        'cache_ttl': float(args['--cache-ttl']),
+    }
+
+def journalMode(ctx):
+    if ctx['backend'] != 'sqlite':
+        return None
+    mode = (ctx.get('pragmas') or {}).get('journal_mode')
+    if mode:
+        return mode.lower()
+    return 'wal' if ctx['wal'] else 'delete'
+
+def runOnce(name, workload, ctx):
+    if ctx['backend'] == 'sqlite':
+        if ctx['storage'] == 'memory' and not workload['perConnection']:
+            print('%s opens connections of its own, skipped for memory storage.' % name)
+            return
+        if storage.inMemory(ctx) and ctx.get('cache', 'warm') != 'warm':
+            print('%s cache state needs a database file, skipped for %s storage.' % (ctx['cache'], ctx['storage']))
+            return
+        ctx = dict(ctx, db = storage.path(ctx))
+    results.context = {
+        'workload': name, 'backend': ctx['backend'], 'journal_mode': journalMode(ctx),
+        'rows': ctx['rows'], 'iterations': ctx['iterations'], 'batch': ctx.get('batch'), 'txn': ctx.get('txn'),
+        'run': ctx['run'],
+    }
+    if ctx.get('pragmas') is not None:
+        results.context['pragma_profile'] = ctx['pragma_profile']
+        results.context['pragmas'] = pragmas.describe(ctx['pragmas'])
+    if soak.duration is not None:
+        results.context['duration'] = soak.duration
+        results.context['warmup_duration'] = soak.warmup
+    if ctx.get('retry') is not None:
+        results.context['retry'] = ctx['retry']
+        results.context['begin'] = ctx.get('begin')
+    retry.configure(ctx.get('retry', 'builtin'), ctx.get('begin', 'deferred'))
+    if ctx.get('storage') is not None:
+        results.context['storage'] = ctx['storage']
+    retry.phases.clear()
+    if ctx['backend'] == 'pgsql':
+        ioStats.configure([], ctx['pgdata'])
+    else:
+        ioStats.configure([] if storage.inMemory(ctx) else [ctx['db']])
+    held = storage.hold(ctx)
+    try:
+        if workload['fixture']:
+            fixtures.restore(ctx)
+        elif not held:
+            bench.resetDatabase(ctx)
+        f = workload[ctx['backend']]
+        if ctx.get('storage') == 'memory':
+            f(held, ctx)
+        elif workload['perConnection']:
+            bench.withConnection(ctx, lambda conn: f(conn, ctx))
+        else:
+            f(ctx)
+    finally:
+        storage.release()
+
+def runWorkload(name, ctx):
+    workload = bench.registry[name]
+    if workload[ctx['backend']] is None:
+        print('%s is not available for %s, skipped.' % (name, ctx['backend']))
+        return
+    runs = ctx['warmup'] + ctx['repeat']
+    for i in range(runs):
+        warmup = i < ctx['warmup']
+        print('=== %s with %s (%s %d/%d)' % (
+            name, ctx['backend'], 'warmup' if warmup else 'run', i + 1 if warmup else i + 1 - ctx['warmup'],
+            ctx['warmup'] if warmup else ctx['repeat']
+        ))
+        bench.reporting = not warmup
+        try:
+            runOnce(name, workload, dict(ctx, run = i - ctx['warmup']))
+        finally:
+            bench.reporting = True
+
+def printSweep(keys):
+    print('=== throughput by %s' % ', '.join(keys))
+    for r in results.records:
+        if 'rows_per_sec' in r:
+            rate = '%10.1f records/sec' % r['rows_per_sec']
+        elif 'ops_per_sec' in r:
+            rate = '%10.1f ops/sec    ' % r['ops_per_sec']
+        else:
+            continue
+        if 'p99_ms' in r:
+            rate += ' p99=%9.3fms' % r['p99_ms']
+        point = ' '.join('%s=%s' % (k, r.get(k)) for k in keys if r.get(k) is not None)
+        print('%-10s %-6s %s %s  %s' % (r['workload'], r['backend'], rate, point, r['phase']))
+
+def sweptValues(allVariants, key):
+    return {str(v.get(key)) for vs in allVariants.values() for v in vs if key in v}
+
+def pgsqlVersion():
+    version = []
+    def query(conn):
+        cur = conn.cursor()
+        cur.execute("show server_version")
+        version.append(cur.fetchone()[0])
+    bench.withPgsqlConnection(query)
+    return version[0]
+
+def main(argv = None):
+    args = docopt(__doc__, argv)
+    if args['--list']:
+        for name in bench.registry:
+            print(name)
+        return
+    names = args['<workload>'] or list(bench.registry)
+    for name in names:
+        if name not in bench.registry:
+            sys.exit('Unknown workload: %s (use --list to see available ones)' % name)
+    backends = args['--backend'].split(',')
+    for backend in backends:
+        if backend not in ('sqlite', 'pgsql'):
+            sys.exit('Unknown backend: %s' % backend)
+    try:
+        allVariants = {
+            (name, backend): variants(args, backend, bench.registry[name]['params'])
+            for name in names for backend in backends
+        }
+    except ValueError as e:
+        sys.exit(str(e))
+    ctx = makeContext(args)
+    memory.enabled = args['--memory'] or args['--tracemalloc']
+    memory.tracing = args['--tracemalloc']
+    ioStats.enabled = args['--io']
+    if args['--duration']:
+        soak.duration = float(args['--duration'])
+        soak.warmup = float(args['--warmup-duration'])
+    if args['--interval']:
+        timeseries.interval = float(args['--interval'])
+        if 'pgsql' in backends:
+            timeseries.probes.append(timeseries.autovacuumProbe(bench.connectPgsql))
+    for name in names:
+        for backend in backends:
+            for v in allVariants[(name, backend)]:
+                runWorkload(name, dict(ctx, backend = backend, **v))
+    swept = [k for k in [
+        'batch', 'txn', 'writers', 'readers', 'pragma_profile', 'retry', 'begin', 'connection', 'clients', 'pool_size',
+        'rate', 'arrival', 'distribution', 'values_rows', 'read_ratio', 'checkpoint', 'storage', 'cache', 'scale',
+        'result_cache'
+    ] if len(sweptValues(allVariants, k)) > 1]
+    if swept:
+        printSweep(swept)
+    if 'storage' in swept:
+        print('=== engine and durability cost')
+        results.split(results.records)
+    if 'result_cache' in swept:
+        print('=== result cache gain')
+        results.gain(results.records)
+    if args['--output'] or args['--series']:
+        env = results.environment(pgsqlVersion() if 'pgsql' in backends else None)
+        if args['--output']:
+            results.write(args['--output'], env)
+        if args['--series']:
+            timeseries.write(args['--series'], env)
+
+if __name__ == '__main__':
+    main()
@@ -1,74 +1,88 @@
 """Perform select benchmark test.
 
-usage: selectBench.py [-h] [--wal]
-
-options:
-    -h, --help  Show this help message and exit
-    --wal       Use WAL(Write a head log) instead of traditional rollback journal for SQLite.
+Registers the 'select' workload. Running this script is the same as 'runner.py select'.
+Insert 50000 departments and perform simple query using date/time function 50000 times by default
+(see --rows and --iterations). The current time is taken once and bound to every query, so that a
+result cached by --result-cache is the one an uncached query would return.
 """
 
-from docopt import docopt
-import io, datetime, bench
+import io, sys, datetime, bench, latency, soak, cacheState, resultCache
 
-def updateDepartmentBench(conn, beginTranFunc, commitTranFunc, updateFunc):
-    cur = conn.cursor()
-    # Bulk insert 100 records at once.
-    indicies = range(1, 50000)
-    for chunk in [indicies[x:x+100] for x in range(1, len(indicies), 100)]:
-        beginTranFunc(cur)
-        updateFunc(cur, chunk)
-        commitTranFunc(cur)
+def updateDepartmentBench(conn, beginTranFunc, commitTranFunc, updateFunc, hist, ctx):
+    return bench.bulkUpdate(
+        conn, beginTranFunc, commitTranFunc, updateFunc, hist,
+        bench.param(ctx, 'rows', 50000), ctx['batch'],
+        bench.param(ctx, 'txn', ctx['batch'])
+    )
 
-def selectBenchSqlite(conn):
+def selectBenchSqlite(conn, ctx):
     def insertFunc(cur, chunk):
         cur.executemany(
             "insert into departments (department_name, created) values (?, CURRENT_TIMESTAMP)",
             map((lambda i: ("dept%08d" %i,)), chunk)
         )
 
-    def performInsert():
+    def performInsert(hist):
         updateDepartmentBench(
-            conn, lambda cur: cur.execute('BEGIN TRANSACTION'), lambda cur: cur.execute('COMMIT'), insertFunc
+            conn, lambda cur: cur.execute('BEGIN TRANSACTION'), lambda cur: cur.execute('COMMIT'), insertFunc, hist, ctx
         )
 
-    def performSelect():
+    cache = resultCache.create(ctx)
+
+    def performSelect(conn, hist):
         cur = conn.cursor()
+        now = cur.execute("select CURRENT_TIMESTAMP").fetchone()[0]
         # Seems no prepared statement support for sqlite...
-        for i in range(1, 50000):
-            cur.execute("select max(created) from departments where created < datetime(CURRENT_TIMESTAMP, '-1 seconds')")
-            cur.fetchall()
+        for i in soak.repeat(bench.param(ctx, 'iterations', 50000) - 1, 1):
+            start = latency.now()
+            resultCache.read(
+                cache, cur,
+                "select max(created) from departments where created < datetime(?, '-1 seconds')",
+                (now, ), ('departments', )
+            )
+            hist.record(latency.now() - start)
 
     bench.createTableSqlite(conn)
-    bench.withStopwatch("insert departments with SQLite", performInsert)
-    bench.withStopwatch("select departments with SQLite", performSelect)
+    bench.withLatency("insert departments with SQLite", performInsert)
+    title = "select departments with SQLite"
+    resultCache.report(title, cache, cacheState.withLatency(title, conn, ctx, performSelect))
 
-def selectBenchPgsql(conn):
+def selectBenchPgsql(conn, ctx):
     def insertFunc(cur, chunk):
         cur.executemany(
             "insert into departments (department_name, created) values (%s, CURRENT_TIMESTAMP)",
             map((lambda i: ("dept%08d" %i,)), chunk)
         )
 
-    def performInsert():
+    def performInsert(hist):
         updateDepartmentBench(
-            conn, (lambda cur: None), lambda cur: conn.commit(), insertFunc
+            conn, (lambda cur: None), lambda cur: conn.commit(), insertFunc, hist, ctx
         )
 
-    def performSelect():
+    cache = resultCache.create(ctx)
+
+    def performSelect(conn, hist):
         cur = conn.cursor()
+        cur.execute("select CURRENT_TIMESTAMP")
+        now = cur.fetchone()[0]
         cur.execute(
-            "prepare myquery as "
-            "select max(created) from departments where created < CURRENT_TIMESTAMP + '-1 seconds'"
+            "prepare myquery (timestamptz) as "
+            "select max(created) from departments where created < $1 + '-1 seconds'"
         )
-        for i in range(1, 50000):
-            cur.execute("execute myquery")
-            cur.fetchall()
+        for i in soak.repeat(bench.param(ctx, 'iterations', 50000) - 1, 1):
+            start = latency.now()
+            resultCache.read(cache, cur, "execute myquery (%s)", (now, ), ('departments', ))
+            hist.record(latency.now() - start)
             
     bench.createTablePgsql(conn)
-    bench.withStopwatch("insert departments with Postgres", performInsert)
-    bench.withStopwatch("select departments with Postgres", performSelect)
+    bench.withLatency("insert departments with Postgres", performInsert)
+    title = "select departments with Postgres"
+    resultCache.report(title, cache, cacheState.withLatency(title, conn, ctx, performSelect))
+
+bench.register(
+    'select', sqlite = selectBenchSqlite, pgsql = selectBenchPgsql, params = ['batch', 'txn', 'cache', 'result_cache']
+)
 
 if __name__ == '__main__':
-    args = docopt(__doc__)
-    bench.withSqliteConnection("/tmp/test.db", selectBenchSqlite, isolationLevel = None, useWal = args["--wal"])
-    bench.withPgsqlConnection(selectBenchPgsql)
+    import runner
+    runner.main(['select'] + sys.argv[1:])
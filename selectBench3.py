@@ -1,27 +1,22 @@
 """Perform select benchmark test.
 
-usage: selectBench3.py [-h] [--wal]
-
-options:
-    -h, --help  Show this help message and exit
-    --wal       Use WAL(Write a head log) instead of traditional rollback journal for SQLite.
+Registers the 'select3' workload. Running this script is the same as 'runner.py select3'.
+Insert 50000 users and perform query using inner join 500 times by default
+(see --rows and --iterations).
 """
 
-from docopt import docopt
-import io, datetime, bench
+import io, sys, datetime, bench, latency, soak, cacheState, resultCache
 
 address = ['Tokyo', 'Chiba', 'Saitama', 'Kanagawa', 'Osaka', 'Kyoto']
 
-def bulkUpdate(conn, beginTranFunc, commitTranFunc, updateFunc):
-    cur = conn.cursor()
-    # Bulk insert 100 records at once.
-    indicies = range(1, 50000)
-    for chunk in [indicies[x:x+100] for x in range(1, len(indicies), 100)]:
-        beginTranFunc(cur)
-        updateFunc(cur, chunk)
-        commitTranFunc(cur)
+def bulkUpdate(conn, beginTranFunc, commitTranFunc, updateFunc, hist, ctx):
+    return bench.bulkUpdate(
+        conn, beginTranFunc, commitTranFunc, updateFunc, hist,
+        bench.param(ctx, 'rows', 50000), ctx['batch'],
+        bench.param(ctx, 'txn', ctx['batch'])
+    )
 
-def selectBenchSqlite(conn):
+def selectBenchSqlite(conn, ctx):
     def insertAddress(cur):
         cur.executemany(
             "insert into addresses (address) values (?)",
@@ -40,29 +35,34 @@ def selectBenchSqlite(conn):
                 [aid, "user%08d" %i, "first%08d" %i, "last%08d" %i]
             )
 
-    def performInsert():
+    def performInsert(hist):
         cur = conn.cursor()
         insertAddress(cur)
         bulkUpdate(
             conn, 
-            lambda cur: cur.execute('BEGIN TRANSACTION'), lambda cur: cur.execute('COMMIT'), insertFunc
+            lambda cur: cur.execute('BEGIN TRANSACTION'), lambda cur: cur.execute('COMMIT'), insertFunc, hist, ctx
         )
 
-    def performSelect():
+    cache = resultCache.create(ctx)
+
+    def performSelect(conn, hist):
         cur = conn.cursor()
-        # Seems no prepared statement support for sqlite...
-        for i in range(1, 500):
-            cur.execute(
+        # sqlite3 reuses prepared statements from its per connection cache (see statementBench.py).
+        for i in soak.repeat(bench.param(ctx, 'iterations', 500) - 1, 1):
+            start = latency.now()
+            resultCache.read(
+                cache, cur,
                 "select count(*) from users u inner join addresses a on u.address_id = a.address_id where address = ?",
-                (address[i % len(address)],)
+                (address[i % len(address)],), ('users', 'addresses')
             )
-            cur.fetchall()
+            hist.record(latency.now() - start)
 
     bench.createTableSqlite(conn)
-    bench.withStopwatch("insert departments with SQLite", performInsert)
-    bench.withStopwatch("select departments with SQLite", performSelect)
+    bench.withLatency("insert departments with SQLite", performInsert)
+    title = "select departments with SQLite"
+    resultCache.report(title, cache, cacheState.withLatency(title, conn, ctx, performSelect))
 
-def selectBenchPgsql(conn):
+def selectBenchPgsql(conn, ctx):
     def insertAddress(cur):
         cur.executemany(
             "insert into addresses (address) values (%s)",
@@ -81,28 +81,35 @@ def selectBenchPgsql(conn):
                 [aid, "user%08d" %i, "first%08d" %i, "last%08d" %i]
             )
 
-    def performInsert():
+    def performInsert(hist):
         cur = conn.cursor()
         insertAddress(cur)
         bulkUpdate(
-            conn, (lambda cur: None), lambda cur: conn.commit(), insertFunc
+            conn, (lambda cur: None), lambda cur: conn.commit(), insertFunc, hist, ctx
         )
 
-    def performSelect():
+    cache = resultCache.create(ctx)
+
+    def performSelect(conn, hist):
         cur = conn.cursor()
         cur.execute(
             "prepare myquery as "
             "select count(*) from users u inner join addresses a on u.address_id = a.address_id where address = $1"
         )
-        for i in range(1, 500):
-            cur.execute("execute myquery (%s)", (address[i % len(address)],))
-            cur.fetchall()
+        for i in soak.repeat(bench.param(ctx, 'iterations', 500) - 1, 1):
+            start = latency.now()
+            resultCache.read(cache, cur, "execute myquery (%s)", (address[i % len(address)],), ('users', 'addresses'))
+            hist.record(latency.now() - start)
             
     bench.createTablePgsql(conn)
-    bench.withStopwatch("insert departments with Postgres", performInsert)
-    bench.withStopwatch("select departments with Postgres", performSelect)
+    bench.withLatency("insert departments with Postgres", performInsert)
+    title = "select departments with Postgres"
+    resultCache.report(title, cache, cacheState.withLatency(title, conn, ctx, performSelect))
+
+bench.register(
+    'select3', sqlite = selectBenchSqlite, pgsql = selectBenchPgsql, params = ['batch', 'txn', 'cache', 'result_cache']
+)
 
 if __name__ == '__main__':
-    args = docopt(__doc__)
-    bench.withSqliteConnection("/tmp/test.db", selectBenchSqlite, isolationLevel = None, useWal = args["--wal"])
-    bench.withPgsqlConnection(selectBenchPgsql)
+    import runner
+    runner.main(['select3'] + sys.argv[1:])
@@ -1,28 +1,23 @@
 """Perform select benchmark test.
 
-usage: selectBench4.py [-h] [--wal]
-
-options:
-    -h, --help  Show this help message and exit
-    --wal       Use WAL(Write a head log) instead of traditional rollback journal for SQLite.
+Registers the 'select4' workload. Running this script is the same as 'runner.py select4'.
+Insert 50000 users and perform query using outer join 500 times by default
+(see --rows and --iterations).
 """
 
-from docopt import docopt
-import io, datetime, bench
+import io, sys, datetime, bench, latency, soak, cacheState
 
 address = ['Tokyo', 'Chiba', 'Saitama', 'Kanagawa', 'Osaka', 'Kyoto']
 department = ['Sales1', 'Sales2', 'Consulting', 'HumanResources', 'Marketing']
 
-def bulkUpdate(conn, beginTranFunc, commitTranFunc, updateFunc):
-    cur = conn.cursor()
-    # Bulk insert 100 records at once.
-    indicies = range(1, 50000)
-    for chunk in [indicies[x:x+100] for x in range(1, len(indicies), 100)]:
-        beginTranFunc(cur)
-        updateFunc(cur, chunk)
-        commitTranFunc(cur)
-
-def selectBenchSqlite(conn):
+def bulkUpdate(conn, beginTranFunc, commitTranFunc, updateFunc, hist, ctx):
+    return bench.bulkUpdate(
+        conn, beginTranFunc, commitTranFunc, updateFunc, hist,
+        bench.param(ctx, 'rows', 50000), ctx['batch'],
+        bench.param(ctx, 'txn', ctx['batch'])
+    )
+
+def populateSqlite(conn, ctx, hist):
     def insertAddress(cur):
         cur.executemany(
             "insert into addresses (address) values (?)",
@@ -68,22 +63,26 @@ def selectBenchSqlite(conn):
                     [uid, did]
                 )
 
-    def performInsert():
-        cur = conn.cursor()
-        insertAddress(cur)
-        insertDepartment(cur)
-        bulkUpdate(
-            conn, 
-            lambda cur: cur.execute('BEGIN TRANSACTION'), lambda cur: cur.execute('COMMIT'), insertFunc
-        )
-        bulkUpdate(
-            conn, 
-            lambda cur: cur.execute('BEGIN TRANSACTION'), lambda cur: cur.execute('COMMIT'), insertFunc2
-        )
-
-    def performSelect():
+    cur = conn.cursor()
+    insertAddress(cur)
+    insertDepartment(cur)
+    bulkUpdate(
+        conn, 
+        lambda cur: cur.execute('BEGIN TRANSACTION'), lambda cur: cur.execute('COMMIT'), insertFunc, hist, ctx
+    )
+    bulkUpdate(
+        conn, 
+        lambda cur: cur.execute('BEGIN TRANSACTION'), lambda cur: cur.execute('COMMIT'), insertFunc2, hist, ctx
+    )
+
+def selectBenchSqlite(conn, ctx):
+    def performInsert(hist):
+        populateSqlite(conn, ctx, hist)
+
+    def performSelect(conn, hist):
         cur = conn.cursor()
-        for i in range(1, 500):
+        for i in soak.repeat(bench.param(ctx, 'iterations', 500) - 1, 1):
+            start = latency.now()
             cur.execute(
                 """
                 select count(u.user_id) from users u
@@ -94,12 +93,13 @@ def selectBenchSqlite(conn):
                 """
             )
             cur.fetchone()
+            hist.record(latency.now() - start)
 
     bench.createTableSqlite(conn)
-    bench.withStopwatch("insert departments with SQLite", performInsert)
-    bench.withStopwatch("select departments with SQLite", performSelect)
+    bench.withLatency("insert departments with SQLite", performInsert)
+    cacheState.withLatency("select departments with SQLite", conn, ctx, performSelect)
 
-def selectBenchPgsql(conn):
+def populatePgsql(conn, ctx, hist):
     def insertAddress(cur):
         cur.executemany(
             "insert into addresses (address) values (%s)",
@@ -145,18 +145,21 @@ def selectBenchPgsql(conn):
                     [uid, did]
                 )
 
-    def performInsert():
-        cur = conn.cursor()
-        insertAddress(cur)
-        insertDepartment(cur)
-        bulkUpdate(
-            conn, (lambda cur: None), lambda cur: conn.commit(), insertFunc
-        )
-        bulkUpdate(
-            conn, (lambda cur: None), lambda cur: conn.commit(), insertFunc2
-        )
-
-    def performSelect():
+    cur = conn.cursor()
+    insertAddress(cur)
+    insertDepartment(cur)
+    bulkUpdate(
+        conn, (lambda cur: None), lambda cur: conn.commit(), insertFunc, hist, ctx
+    )
+    bulkUpdate(
+        conn, (lambda cur: None), lambda cur: conn.commit(), insertFunc2, hist, ctx
+    )
+
+def selectBenchPgsql(conn, ctx):
+    def performInsert(hist):
+        populatePgsql(conn, ctx, hist)
+
+    def performSelect(conn, hist):
         cur = conn.cursor()
         cur.execute(
             "prepare myquery as "
@@ -168,15 +171,18 @@ def selectBenchPgsql(conn):
             where (d.department_name = 'Sales1' or d.department_name is null) and address = 'Tokyo'
             """
         )
-        for i in range(1, 500):
+        for i in soak.repeat(bench.param(ctx, 'iterations', 500) - 1, 1):
+            start = latency.now()
             cur.execute("execute myquery")
             cur.fetchone()
+            hist.record(latency.now() - start)
             
     bench.createTablePgsql(conn)
-    bench.withStopwatch("insert departments with Postgres", performInsert)
-    bench.withStopwatch("select departments with Postgres", performSelect)
+    bench.withLatency("insert departments with Postgres", performInsert)
+    cacheState.withLatency("select departments with Postgres", conn, ctx, performSelect)
+
+bench.register('select4', sqlite = selectBenchSqlite, pgsql = selectBenchPgsql, params = ['batch', 'txn', 'cache'])
 
 if __name__ == '__main__':
-    args = docopt(__doc__)
-    bench.withSqliteConnection("/tmp/test.db", selectBenchSqlite, isolationLevel = None, useWal = args["--wal"])
-    bench.withPgsqlConnection(selectBenchPgsql)
+    import runner
+    runner.main(['select4'] + sys.argv[1:])
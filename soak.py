@@ -0,0 +1,88 @@
+"""Soak mode: benchmark phases run for a fixed time instead of a fixed count.
+
+With 'duration' set (runner --duration), bench.withStopwatch starts a Phase and the operation
+loops of the workloads, written with repeat(), run until its deadline instead of n times. The
+first 'warmup' seconds (runner --warmup-duration) are not measured: once they have passed the
+histograms of the phase (see track()) are cleared and its elapsed time starts over, so that
+the reported throughput and latency are those of the steady state. Phases within a phase,
+such as the threads of the concurrent workload or the worker processes of
+concurrent-process, share its deadline.
+Loads of a given amount of data (bench.bulkUpdate, datagen, bulk-load) keep their counts.
+"""
+
+import threading, time
+
+duration = None
+warmup = 0
+# Keys of repeat() past n continue in blocks this far apart, so that callers given disjoint
+# ranges of n keys keep them disjoint.
+KEY_STRIDE = 10 ** 9
+lock = threading.Lock()
+active = []
+
+class Phase:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.warmUntil = self.start + warmup
+        self.deadline = self.warmUntil + duration
+        self.hists = []
+        self.warmed = warmup <= 0
+
+    def check(self):
+        """Return False once the deadline has passed, clearing the histograms after warm-up."""
+        now = time.perf_counter()
+        if not self.warmed and now >= self.warmUntil:
+            with lock:
+                if not self.warmed:
+                    for hist in self.hists:
+                        hist.reset()
+                    self.warmed = True
+        return now < self.deadline
+
+def current():
+    return active[0] if active else None
+
+def begin():
+    """Start a phase unless one is running. Returns the phase to pass to end(), or None."""
+    if duration is None or active:
+        return None
+    phase = Phase()
+    active.append(phase)
+    return phase
+
+def end(phase):
+    if phase is not None:
+        active.remove(phase)
+
+def track(hist):
+    """Have hist cleared at the end of the warm-up of the running phase."""
+    phase = current()
+    if phase is not None:
+        with lock:
+            phase.hists.append(hist)
+
+def measuring():
+    """Return whether the warm-up of the running phase, if any, is over."""
+    phase = current()
+    return phase is None or phase.warmed
+
+def measuredFrom(start):
+    """Return the time measurements of a phase started at 'start' count from."""
+    phase = current()
+    if phase is None or warmup <= 0:
+        return start
+    return max(start, phase.warmUntil)
+
+def repeat(n, start = 0):
+    """Keys of the iterations of an operation loop: start to start + n - 1, or as many as fit
+    before the deadline of the running phase."""
+    phase = current()
+    if phase is None:
+        return range(start, start + n)
+    return untilDeadline(phase, max(1, n), start)
+
+def untilDeadline(phase, n, start):
+    i = 0
+    while phase.check():
+        yield start + i % n + i // n * KEY_STRIDE
+        i += 1
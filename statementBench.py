@@ -0,0 +1,134 @@
+"""Perform statement cache benchmark test.
+
+Registers the 'statement-cache' workload. Running this script is the same as
+'runner.py statement-cache'. Loads the data of select4 (50000 users by default, see --rows)
+and runs the inner join of select3 and the outer join of select4 500 times each (see
+--iterations) as:
+    parameterized  The same SQL text with bound parameters.
+    unique text    Values inlined into the SQL text, which differs on every call like
+                   dynamically built SQL does.
+SQLite runs both on connections with a statement cache of 0, 128 (the default) and 1024
+statements (cached_statements of sqlite3.connect). Every connection first runs the
+parameterized queries as many times unmeasured, so that each cache size starts from a warm
+page cache rather than the first one paying for it. Postgres runs them plus a PREPAREd
+statement. The prepare overhead is estimated as the difference of the mean latency of
+parameterized queries without and with the statement cache (SQLite) or without and with
+PREPARE (Postgres).
+"""
+
+import sys, bench, latency, soak, selectBench4
+
+address = selectBench4.address
+department = selectBench4.department
+
+CACHE_SIZES = [0, 128, 1024]
+
+QUERIES = {
+    'inner join': (
+        "select count(*) from users u inner join addresses a on u.address_id = a.address_id where address = %s",
+        lambda i: (address[i % len(address)],)
+    ),
+    'outer join': (
+        """
+        select count(u.user_id) from users u
+        inner join addresses a on u.address_id = a.address_id
+        left join user_department ud on u.user_id = ud.user_id
+        inner join departments d on ud.department_id = d.department_id
+        where (d.department_name = %s or d.department_name is null) and address = %s
+        """,
+        lambda i: (department[i % len(department)], address[i % len(address)])
+    ),
+}
+
+def parameterized(template, placeholder, argsFor):
+    sql = template % ((placeholder, ) * len(argsFor(0)))
+    return lambda i: (sql, argsFor(i))
+
+def uniqueText(template, argsFor):
+    # The trailing comment keeps the text unique even when the values repeat.
+    return lambda i: (template % tuple("'%s'" % v for v in argsFor(i)) + " /* %d */" % i, ())
+
+def performQueries(cur, statementFor, hist, n):
+    for i in soak.repeat(n - 1, 1):
+        start = latency.now()
+        cur.execute(*statementFor(i))
+        cur.fetchall()
+        hist.record(latency.now() - start)
+
+def measure(title, conn, statementFor, n):
+    hist = latency.Histogram(title)
+    r = bench.withStopwatch(title, lambda: performQueries(conn.cursor(), statementFor, hist, n), hist)
+    return hist, r
+
+def warmUp(conn, n):
+    cur = conn.cursor()
+    for name, (template, argsFor) in QUERIES.items():
+        performQueries(cur, parameterized(template, '?', argsFor), latency.Histogram(), n)
+
+def reportPrepare(title, preparing, reusing):
+    # Both are (histogram, record) of the same query, with and without a prepare per call.
+    hist, r = preparing
+    overhead = (hist.mean() - reusing[0].mean()) / 1e6
+    if r is not None:
+        r['prepare_ms'] = overhead
+        print('%s prepare overhead %.3fms per statement (estimated)' % (title, overhead))
+
+def statementBenchSqlite(ctx):
+    n = bench.param(ctx, 'iterations', 500)
+
+    def populate(conn):
+        bench.createTableSqlite(conn)
+        bench.withLatency("insert users with SQLite", lambda hist: selectBench4.populateSqlite(conn, ctx, hist))
+
+    bench.withConnection(ctx, populate)
+    phases = {}
+    for size in CACHE_SIZES:
+        conn = bench.connect(dict(ctx, cached_statements = size))
+        try:
+            warmUp(conn, n)
+            for name, (template, argsFor) in QUERIES.items():
+                for mode, statementFor in [
+                    ('parameterized', parameterized(template, '?', argsFor)),
+                    ('unique text', uniqueText(template, argsFor)),
+                ]:
+                    title = "%s %s with SQLite cached_statements=%d" % (name, mode, size)
+                    phases[(name, mode, size)] = measure(title, conn, statementFor, n)
+        finally:
+            conn.close()
+    for name in QUERIES:
+        reportPrepare(
+            "%s with SQLite" % name, phases[(name, 'parameterized', 0)], phases[(name, 'parameterized', 128)]
+        )
+
+def statementBenchPgsql(ctx):
+    n = bench.param(ctx, 'iterations', 500)
+
+    def perform(conn):
+        bench.createTablePgsql(conn)
+        bench.withLatency("insert users with Postgres", lambda hist: selectBench4.populatePgsql(conn, ctx, hist))
+        cur = conn.cursor()
+        for index, (name, (template, argsFor)) in enumerate(QUERIES.items()):
+            statement = 'query%d' % index
+            cur.execute("prepare %s as %s" % (
+                statement, template % tuple('$%d' % (i + 1) for i in range(len(argsFor(0))))
+            ))
+            executeSql = "execute %s (%s)" % (statement, ', '.join(['%s'] * len(argsFor(0))))
+            phases = {}
+            for mode, statementFor in [
+                ('prepared', lambda i: (executeSql, argsFor(i))),
+                ('parameterized', parameterized(template, '%s', argsFor)),
+                ('unique text', uniqueText(template, argsFor)),
+            ]:
+                phases[mode] = measure("%s %s with Postgres" % (name, mode), conn, statementFor, n)
+            reportPrepare("%s with Postgres" % name, phases['parameterized'], phases['prepared'])
+
+    bench.withConnection(ctx, perform)
+
+bench.register(
+    'statement-cache', sqlite = statementBenchSqlite, pgsql = statementBenchPgsql, perConnection = False,
+    params = ['batch', 'txn']
+)
+
+if __name__ == '__main__':
+    import runner
+    runner.main(['statement-cache'] + sys.argv[1:])
@@ -0,0 +1,59 @@
+"""Where the SQLite benchmark database lives (runner --storage).
+
+    disk           The --db file.
+    tmpfs          A file of the same name under --tmpfs (RAM backed), so fsync returns at once
+                   but the file system and journal work is still done.
+    memory         :memory:, private to each connection, so only workloads run on the one
+                   connection opened by the runner can use it.
+    shared-memory  An in-memory database shared by the connections of the process through a
+                   URI with cache=shared, kept alive by a connection held for the run. Shared
+                   cache locks tables rather than the database, and it cannot be shared with
+                   other processes.
+Run the same workloads on memory and on disk, with --pragma=synchronous=OFF,NORMAL,FULL, and
+'results.py split' tells what the engine costs from what durability costs.
+"""
+
+import os, sqlite3, bench
+
+STORAGES = ('disk', 'tmpfs', 'memory', 'shared-memory')
+SHARED_URI = 'file:bench?mode=memory&cache=shared'
+
+# Connection keeping the in-memory database of the run alive, see hold().
+held = None
+
+def path(ctx):
+    storage = ctx.get('storage', 'disk')
+    if storage == 'disk':
+        return ctx['db']
+    if storage == 'tmpfs':
+        return os.path.join(ctx['tmpfs'], os.path.basename(ctx['db']))
+    if storage == 'memory':
+        return ':memory:'
+    if storage == 'shared-memory':
+        return SHARED_URI
+    raise ValueError('Unknown storage: %s (known: %s)' % (storage, ', '.join(STORAGES)))
+
+def inMemory(ctx):
+    return ctx.get('storage') in ('memory', 'shared-memory')
+
+def hold(ctx):
+    """Open a new, empty in-memory database for the run and return its connection, or None
+    if the database of ctx is a file."""
+    global held
+    if inMemory(ctx):
+        held = bench.connect(ctx)
+    return held
+
+def release():
+    global held
+    if held is not None:
+        held.close()
+        held = None
+
+def load(path):
+    """Copy the database file at path into the held in-memory database."""
+    src = sqlite3.connect(path)
+    try:
+        src.backup(held)
+    finally:
+        src.close()
@@ -0,0 +1,158 @@
+"""Throughput and latency over time within benchmark phases.
+
+With 'interval' set (runner --interval), bench.withStopwatch runs a Sampler for every phase.
+Every 'interval' seconds it takes the samples each tracked histogram recorded since the
+previous interval and appends a row to 'series':
+    phase, source  Title of the phase and what recorded the samples: the phase itself, a
+                   client thread (see track()) or a process.
+    t, time        Seconds from the start of the phase to the end of the interval, and the
+                   wall-clock time, to line up phases and processes.
+    count, ops_per_sec, p50_ms, p99_ms, max_ms
+                   Operations of the interval. max_ms is that of the bucket.
+Events such as checkpoints, large commits or autovacuum runs (see probes) are added to
+'events' by mark(). runner --series writes both with the run metadata.
+"""
+
+import csv, json, threading, time, latency, results
+
+interval = None
+series = []
+events = []
+# Called every interval by the outermost sampler, each returning a list of (event, detail).
+probes = []
+lock = threading.Lock()
+# Samplers of the running phases, outermost first.
+active = []
+
+class Sampler:
+    def __init__(self, phase):
+        self.phase = phase
+        self.tracked = []
+        self.rows = []
+        self.stopped = threading.Event()
+        self.outermost = False
+
+    def track(self, hist, source):
+        with lock:
+            self.tracked.append([source, hist, hist.copy()])
+
+    def sample(self):
+        t = time.perf_counter() - self.start
+        elapsed = t - self.last
+        self.last = t
+        with lock:
+            tracked = list(self.tracked)
+        for entry in tracked:
+            source, hist, previous = entry
+            entry[2] = hist.copy()
+            if any(a < b for a, b in zip(entry[2].counts, previous.counts)):
+                # Reset at the end of a soak warm-up, everything in it was recorded since.
+                previous = latency.Histogram()
+            h = entry[2].since(previous)
+            row = dict(
+                results.context, phase = self.phase, source = source, t = round(t, 3), time = time.time(),
+                count = h.count, ops_per_sec = h.count / elapsed if elapsed > 0 else 0
+            )
+            if h.count:
+                row.update(p50_ms = h.percentile(50) / 1e6, p99_ms = h.percentile(99) / 1e6, max_ms = h.max / 1e6)
+            self.rows.append(row)
+        if self.outermost:
+            for probe in probes:
+                for event, detail in probe():
+                    mark(event, detail)
+
+    def run(self):
+        while not self.stopped.wait(interval):
+            self.sample()
+
+    def begin(self):
+        self.start = time.perf_counter()
+        self.last = 0
+        with lock:
+            self.outermost = not active
+            active.append(self)
+        self.thread = threading.Thread(target = self.run, daemon = True)
+        self.thread.start()
+
+    def end(self):
+        """Stop sampling after a last, partial interval. Returns the rows of this phase."""
+        self.stopped.set()
+        self.thread.join()
+        self.sample()
+        with lock:
+            active.remove(self)
+            series.extend(self.rows)
+        return self.rows
+
+def track(hist, source):
+    """Have the samples of hist, recorded by a client thread or the like, sampled within the
+    innermost running phase."""
+    with lock:
+        sampler = active[-1] if active else None
+    if sampler:
+        sampler.track(hist, source)
+
+def mark(event, detail = ''):
+    with lock:
+        sampler = active[-1] if active else None
+        events.append(dict(
+            results.context, phase = sampler.phase if sampler else None,
+            t = round(time.perf_counter() - sampler.start, 3) if sampler else None, time = time.time(),
+            event = event, detail = detail
+        ))
+
+def describe(title, rows):
+    lines = []
+    sources = []
+    for r in rows:
+        if r['source'] not in sources:
+            sources.append(r['source'])
+    for source in sources:
+        rates = [r['ops_per_sec'] for r in rows if r['source'] == source]
+        lines.append('%s series (%s): %d intervals ops/sec first=%.1f last=%.1f min=%.1f max=%.1f' % (
+            title, source, len(rates), rates[0], rates[-1], min(rates), max(rates)
+        ))
+    return '\n'.join(lines)
+
+def autovacuumProbe(connect):
+    """Probe marking autovacuum and autoanalyze runs on the tables of the Postgres database."""
+    counts = {}
+
+    def probe():
+        if results.context.get('backend') != 'pgsql':
+            return []
+        # Connected every time, since fixtures.py drops the database between runs.
+        conn = connect()
+        try:
+            cur = conn.cursor()
+            cur.execute("select relname, autovacuum_count, autoanalyze_count from pg_stat_user_tables")
+            rows = cur.fetchall()
+        finally:
+            conn.close()
+        found = []
+        for name, vacuums, analyzes in rows:
+            before = counts.get(name, (vacuums, analyzes))
+            if vacuums > before[0]:
+                found.append(('autovacuum', name))
+            if analyzes > before[1]:
+                found.append(('autoanalyze', name))
+            counts[name] = (vacuums, analyzes)
+        return found
+
+    return probe
+
+def write(path, env):
+    if path.endswith('.csv'):
+        rows = [dict(env, **r) for r in sorted(series + events, key = lambda r: r['time'])]
+        fields = []
+        for r in rows:
+            for k in r:
+                if k not in fields:
+                    fields.append(k)
+        with open(path, 'w', newline = '') as f:
+            w = csv.DictWriter(f, fieldnames = fields)
+            w.writeheader()
+            w.writerows(rows)
+    else:
+        with open(path, 'w') as f:
+            json.dump({'environment': env, 'series': series, 'events': events}, f, indent = 2)
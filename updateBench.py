@@ -1,79 +1,83 @@
 """Perform update benchmark test.
 
-usage: updateBench.py [-h] [--wal]
-
-options:
-    -h, --help  Show this help message and exit
-    --wal       Use WAL(Write a head log) instead of traditional rollback journal for SQLite.
+Registers the 'update' workload. Running this script is the same as 'runner.py update'.
+Insert and then update 50000 records by default, committing every 100 records (see --rows and --batch).
 """
 
-from docopt import docopt
-import io, datetime, bench
+import io, sys, datetime, bench, ioStats
+
+# Row data of a department passed to the database: its name and creation timestamp, and the
+# new name of an update.
+ROW_BYTES = len('dept%08d' % 0) + len('2000-01-01 00:00:00')
+UPDATE_BYTES = len('deptUpdated%08d' % 0)
 
-def updateDepartmentBench(conn, beginTranFunc, commitTranFunc, updateFunc):
-    cur = conn.cursor()
-    # Bulk insert 100 records at once.
-    indicies = range(1, 50000)
-    for chunk in [indicies[x:x+100] for x in range(1, len(indicies), 100)]:
-        beginTranFunc(cur)
-        updateFunc(cur, chunk)
-        commitTranFunc(cur)
+def updateDepartmentBench(conn, beginTranFunc, commitTranFunc, updateFunc, hist, ctx):
+    return bench.bulkUpdate(
+        conn, beginTranFunc, commitTranFunc, updateFunc, hist,
+        bench.param(ctx, 'rows', 50000), ctx['batch'],
+        bench.param(ctx, 'txn', ctx['batch'])
+    )
 
-def updateBenchSqlite(conn):
+def updateBenchSqlite(conn, ctx):
     def insertFunc(cur, chunk):
         cur.executemany(
             "insert into departments (department_name, created) values (?, CURRENT_TIMESTAMP)",
             map((lambda i: ("dept%08d" %i,)), chunk)
         )
+        ioStats.addLogical(len(chunk) * ROW_BYTES)
 
     def updateFunc(cur, chunk):
         cur.executemany(
             "update departments set department_name = ? where department_name = ?",
             map((lambda i: ("deptUpdated%08d" %i, "dept%08d" %i)), chunk)
         )
+        ioStats.addLogical(len(chunk) * UPDATE_BYTES)
 
-    def performInsert():
-        updateDepartmentBench(
-            conn, lambda cur: cur.execute('BEGIN TRANSACTION'), lambda cur: cur.execute('COMMIT'), insertFunc
+    def performInsert(hist):
+        return updateDepartmentBench(
+            conn, lambda cur: cur.execute('BEGIN TRANSACTION'), lambda cur: cur.execute('COMMIT'), insertFunc, hist, ctx
         )
 
-    def performUpdate():
-        updateDepartmentBench(
-            conn, lambda cur: cur.execute('BEGIN TRANSACTION'), lambda cur: cur.execute('COMMIT'), updateFunc
+    def performUpdate(hist):
+        return updateDepartmentBench(
+            conn, lambda cur: cur.execute('BEGIN TRANSACTION'), lambda cur: cur.execute('COMMIT'), updateFunc, hist, ctx
         )
 
     bench.createTableSqlite(conn)
-    bench.withStopwatch("insert departments with SQLite", performInsert)
-    bench.withStopwatch("update departments with SQLite", performUpdate)
+    bench.withLatency("insert departments with SQLite", performInsert)
+    bench.withLatency("update departments with SQLite", performUpdate)
 
-def updateBenchPgsql(conn):
+def updateBenchPgsql(conn, ctx):
     def insertFunc(cur, chunk):
         cur.executemany(
             "insert into departments (department_name, created) values (%s, CURRENT_TIMESTAMP)",
             map((lambda i: ("dept%08d" %i,)), chunk)
         )
+        ioStats.addLogical(len(chunk) * ROW_BYTES)
 
     def updateFunc(cur, chunk):
         cur.executemany(
             "update departments set department_name = %s where department_name = %s",
             map((lambda i: ("deptUpdated%08d" %i, "dept%08d" %i)), chunk)
         )
+        ioStats.addLogical(len(chunk) * UPDATE_BYTES)
 
-    def performInsert():
-        updateDepartmentBench(
-            conn, (lambda cur: None), lambda cur: conn.commit(), insertFunc
+    def performInsert(hist):
+        return updateDepartmentBench(
+            conn, (lambda cur: None), lambda cur: conn.commit(), insertFunc, hist, ctx
         )
 
-    def performUpdate():
-        updateDepartmentBench(
-            conn, (lambda cur: None), lambda cur: conn.commit(), updateFunc
+    def performUpdate(hist):
+        return updateDepartmentBench(
+            conn, (lambda cur: None), lambda cur: conn.commit(), updateFunc, hist, ctx
         )
 
     bench.createTablePgsql(conn)
-    bench.withStopwatch("insert departments with Postgres", performInsert)
-    bench.withStopwatch("update departments with Postgres", performUpdate)
+    bench.withLatency("insert departments with Postgres", performInsert)
+    bench.withLatency("update departments with Postgres", performUpdate)
+
+bench.register('update', sqlite = updateBenchSqlite, pgsql = updateBenchPgsql, params = ['batch', 'txn'])
 
 if __name__ == '__main__':
-    args = docopt(__doc__)
-    bench.withSqliteConnection("/tmp/test.db", updateBenchSqlite, isolationLevel = None, useWal = args["--wal"])
-    bench.withPgsqlConnection(updateBenchPgsql)
+    import runner
+    runner.main(['update'] + sys.argv[1:])